@@ -0,0 +1,344 @@
+# answer_verifier.py
+# Local, deterministic check of generated multiple-choice answers. Arithmetic
+# expressions, percentages, polynomial simplification and one-variable
+# linear / quadratic equations are evaluated exactly (fractions, no eval());
+# each option is compared with the result so a wrong answer key, no correct
+# option or several correct options are caught without an LLM round trip.
+# Questions it cannot parse (word problems, geometry) are left unverified.
+#
+#   python answer_verifier.py quizzes.jsonl --flagged bad.jsonl
+#   python answer_verifier.py --bank --fix
+import re
+import ast
+import sys
+import json
+import math
+import argparse
+from fractions import Fraction
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:   # quiz_bank imports this module
+    from quiz_bank import QuizQuestion
+
+# -----------------------------
+# 1️⃣ Polynomials over fractions
+# -----------------------------
+# {degree: coefficient}; constants are {0: c}
+Poly = dict[int, Fraction]
+MAX_POWER = 4             # for powers of polynomials
+MAX_CONSTANT_POWER = 64
+
+class Unverifiable(ValueError):
+    pass
+
+def _clean(poly: Poly) -> Poly:
+    return {d: c for d, c in poly.items() if c != 0}
+
+def _add(a: Poly, b: Poly, sign: int = 1) -> Poly:
+    out = dict(a)
+    for d, c in b.items():
+        out[d] = out.get(d, Fraction(0)) + sign * c
+    return _clean(out)
+
+def _mul(a: Poly, b: Poly) -> Poly:
+    out: Poly = {}
+    for da, ca in a.items():
+        for db, cb in b.items():
+            out[da + db] = out.get(da + db, Fraction(0)) + ca * cb
+    return _clean(out)
+
+def _constant(poly: Poly) -> Fraction | None:
+    if any(d != 0 for d in poly):
+        return None
+    return poly.get(0, Fraction(0))
+
+def _evaluate(node: ast.AST, variable: str | None) -> Poly:
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body, variable)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return _clean({0: Fraction(str(node.value))})
+    if isinstance(node, ast.Name):
+        if variable is None or node.id != variable:
+            raise Unverifiable(f"unknown name {node.id}")
+        return {1: Fraction(1)}
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _evaluate(node.operand, variable)
+        return {d: -c for d, c in value.items()} if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.BinOp):
+        left, right = _evaluate(node.left, variable), _evaluate(node.right, variable)
+        if isinstance(node.op, ast.Add):
+            return _add(left, right)
+        if isinstance(node.op, ast.Sub):
+            return _add(left, right, -1)
+        if isinstance(node.op, ast.Mult):
+            return _mul(left, right)
+        if isinstance(node.op, ast.Div):
+            divisor = _constant(right)
+            if divisor is None or divisor == 0:
+                raise Unverifiable("division by a variable or zero")
+            return {d: c / divisor for d, c in left.items()}
+        if isinstance(node.op, ast.Pow):
+            exponent = _constant(right)
+            if exponent is None or exponent.denominator != 1:
+                raise Unverifiable("unsupported exponent")
+            base = _constant(left)
+            if base is not None and abs(exponent) <= MAX_CONSTANT_POWER and (base or exponent >= 0):
+                return _clean({0: base ** int(exponent)})
+            if not 0 <= exponent <= MAX_POWER:
+                raise Unverifiable("unsupported exponent")
+            out: Poly = {0: Fraction(1)}
+            for _ in range(int(exponent)):
+                out = _mul(out, left)
+            return out
+    raise Unverifiable(f"unsupported syntax {type(node).__name__}")
+
+# -----------------------------
+# 2️⃣ Text → expression
+# -----------------------------
+_SYMBOLS = str.maketrans({"×": "*", "·": "*", "÷": "/", "−": "-", "–": "-", "^": "**", "²": "**2", "³": "**3"})
+_THOUSANDS = re.compile(r"(?<=\d),(?=\d{3}\b)")
+_PERCENT_OF = re.compile(r"(\d+(?:\.\d+)?)\s*%\s*of\s*")
+_IMPLICIT = [
+    (re.compile(r"(\d|\))\s*([a-z(])"), r"\1*\2"),   # 2x, 3(x+1), (x+1)(x-1)
+    (re.compile(r"([a-z])\s*(\()"), r"\1*\2"),       # x(x+1)
+]
+
+def _to_python(text: str) -> str:
+    text = _THOUSANDS.sub("", text.lower().translate(_SYMBOLS))
+    text = _PERCENT_OF.sub(r"(\1/100)*", text)
+    text = text.replace("%", "/100")
+    for pattern, repl in _IMPLICIT:
+        text = pattern.sub(repl, text)
+    return text.strip()
+
+def parse_expression(text: str, variable: str | None = None) -> Poly:
+    try:
+        tree = ast.parse(_to_python(text), mode="eval")
+    except SyntaxError:
+        raise Unverifiable(f"cannot parse {text!r}")
+    return _evaluate(tree, variable)
+
+def _variables(text: str) -> set[str]:
+    # Single letters standing alone or glued to numbers / brackets
+    return set(re.findall(r"(?<![a-z])([a-z])(?![a-z])", text.lower()))
+
+# -----------------------------
+# 3️⃣ Question → expected result
+# -----------------------------
+_MATH_CHARS = r"[-+*/^().\s\d×÷·−–²³%a-z]"
+_ASK = re.compile(
+    r"\b(?:what is|what's|calculate|evaluate|compute|find the value of|simplify|expand|find)\s*:?\s*(.+?)\s*\??$"
+)
+# Equations may only contain single-letter names, so the words around them
+# ("solve for x:", "if ..., what is x?") are never part of the match
+_EQUATION_TOKEN = r"(?:[-+*/^().\s\d×÷·−–²³]|(?<![a-z])[a-z](?![a-z]))"
+_EQUATION = re.compile(rf"{_EQUATION_TOKEN}+={_EQUATION_TOKEN}+")
+# "if x = 3, what is 2x + 1?", "evaluate 2x + 5 when x = 3": the equals sign
+# gives a value to substitute, it is not an equation to solve
+_SUBSTITUTION = re.compile(
+    r"\b(?:when|if|given(?: that)?|where)\s+([a-z])\s*=\s*(-?\d+(?:\.\d+)?(?:\s*/\s*\d+)?)\s*,?"
+)
+_ASSIGNMENT = re.compile(r"\s*(?:[a-z]\s*=\s*-?[\d./\s]+|-?[\d./\s]+=\s*[a-z])\s*")
+
+@dataclass
+class Expected:
+    kind: str                               # "value" | "polynomial" | "roots"
+    variable: str | None = None
+    poly: Poly = field(default_factory=dict)
+    roots: list[float] = field(default_factory=list)
+
+def _solve(poly: Poly) -> list[float]:
+    degree = max(poly, default=0)
+    a, b, c = (poly.get(2, Fraction(0)), poly.get(1, Fraction(0)), poly.get(0, Fraction(0)))
+    if degree == 1:
+        return [float(-c / b)]
+    if degree == 2:
+        disc = b * b - 4 * a * c
+        if disc < 0:
+            return []
+        root = math.sqrt(disc)
+        return sorted({(-float(b) - root) / (2 * float(a)), (-float(b) + root) / (2 * float(a))})
+    raise Unverifiable(f"degree {degree} equation")
+
+def _at(poly: Poly, value: Fraction) -> Fraction:
+    return sum((c * value ** d for d, c in poly.items()), Fraction(0))
+
+def _substituted(lowered: str, substitution: re.Match) -> Expected:
+    variable, value = substitution.group(1), _constant(parse_expression(substitution.group(2)))
+    rest = (lowered[:substitution.start()] + " " + lowered[substitution.end():]).strip()
+    match = _ASK.search(rest)
+    if match is None or "=" in rest:
+        raise Unverifiable("substitution without a plain expression to evaluate")
+    expression = match.group(1).strip(" ,")
+    if not re.fullmatch(rf"{_MATH_CHARS}+", expression) or not _variables(expression) <= {variable}:
+        raise Unverifiable("expression has words in it")
+    return Expected("value", None, _clean({0: _at(parse_expression(expression, variable), value)}))
+
+def expected_result(question: str) -> Expected:
+    lowered = _THOUSANDS.sub("", question.strip().lower())
+    substitution = _SUBSTITUTION.search(lowered)
+    if substitution is not None:
+        return _substituted(lowered, substitution)
+    if "=" in lowered:
+        match = _EQUATION.search(lowered)
+        if match is None:
+            raise Unverifiable("no equation found")
+        equation = match.group(0).strip()
+        if _ASSIGNMENT.fullmatch(equation):
+            # "x = 3" on its own states a value; whatever is asked about it is
+            # not recognised, so nothing is "repaired" to match it
+            raise Unverifiable("assignment, not an equation")
+        variables = _variables(equation)
+        if len(variables) != 1:
+            raise Unverifiable("equation is not in one variable")
+        variable = variables.pop()
+        lhs, rhs = equation.split("=", 1)
+        poly = _add(parse_expression(lhs, variable), parse_expression(rhs, variable), -1)
+        return Expected("roots", variable, poly, _solve(poly))
+
+    match = _ASK.search(lowered)
+    if match is None:
+        raise Unverifiable("not an arithmetic or algebra question")
+    expression = match.group(1)
+    variables = _variables(_PERCENT_OF.sub("", expression))
+    if len(variables) > 1 or not re.fullmatch(rf"{_MATH_CHARS}+|.*%\s*of.*", expression):
+        raise Unverifiable("expression has words in it")
+    variable = variables.pop() if variables else None
+    poly = parse_expression(expression, variable)
+    return Expected("value" if variable is None else "polynomial", variable, poly)
+
+# -----------------------------
+# 4️⃣ Options & verdict
+# -----------------------------
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?(?:\s*/\s*\d+)?")
+_MIXED = re.compile(r"^(-?)(\d+)\s+(\d+)/(\d+)$")
+_ANSWER_PREFIX = re.compile(r"^\s*[a-z]\s*=\s*")
+_UNITS = re.compile(r"\s*(?:[a-z]+\.?\s*)+$")
+
+def _option_value(option: str) -> tuple[Fraction, int | None]:
+    # (value, decimal places if the option is a rounded decimal)
+    text = _THOUSANDS.sub("", option.strip().lower()).replace("$", "").rstrip(".")
+    text = _UNITS.sub("", _ANSWER_PREFIX.sub("", text)).strip()
+    mixed = _MIXED.match(text)
+    if mixed:
+        sign = -1 if mixed.group(1) else 1
+        return sign * (int(mixed.group(2)) + Fraction(int(mixed.group(3)), int(mixed.group(4)))), None
+    if not re.fullmatch(r"-?\d+(?:\.\d+)?(?:\s*/\s*\d+)?%?", text):
+        raise Unverifiable(f"option {option!r} is not a number")
+    value = _constant(parse_expression(text))
+    places = len(text.split(".")[1].rstrip("%")) if "." in text and "/" not in text else None
+    return value, places
+
+def _matches(option: str, expected: Expected) -> bool:
+    if expected.kind == "roots":
+        text = _THOUSANDS.sub("", option.lower())
+        numbers = [float(_constant(parse_expression(n))) for n in _NUMBER.findall(text)]
+        if not numbers or re.search(r"no (real )?solution", text):
+            return not expected.roots and not numbers
+        return sorted(set(round(n, 6) for n in numbers)) == sorted(round(r, 6) for r in expected.roots)
+    if expected.kind == "polynomial":
+        return parse_expression(_ANSWER_PREFIX.sub("", option), expected.variable) == expected.poly
+    value, places = _option_value(option)
+    target = _constant(expected.poly)
+    if value == target:
+        return True
+    # "3.33" for 10/3: accept a decimal rounded to the places it shows
+    return places is not None and abs(value - target) <= Fraction(1, 2 * 10 ** places)
+
+# Unverifiable plus what exotic numbers raise on the way ("1e999" is inf,
+# which Fraction rejects; huge powers overflow float)
+UNPARSEABLE = (ValueError, OverflowError, ZeroDivisionError)
+
+@dataclass
+class Verification:
+    status: str                      # ok | wrong_key | no_correct | multiple_correct | unverifiable
+    correct: list[int] = field(default_factory=list)
+    reason: str = ""
+
+    @property
+    def flagged(self) -> bool:
+        return self.status not in ("ok", "unverifiable")
+
+def verify(question: "QuizQuestion") -> Verification:
+    try:
+        expected = expected_result(question.question)
+    except UNPARSEABLE as e:
+        return Verification("unverifiable", reason=str(e) or type(e).__name__)
+
+    correct, unparsed = [], []
+    for i, option in enumerate(question.options):
+        try:
+            if _matches(option, expected):
+                correct.append(i)
+        except UNPARSEABLE:
+            unparsed.append(i)
+    if len(correct) == 1:
+        if correct[0] == question.answer_index:
+            return Verification("ok", correct)
+        if question.answer_index in unparsed:
+            return Verification("unverifiable", correct, "answer option not parseable")
+        return Verification("wrong_key", correct, f"option {'ABCD'[correct[0]]} is correct")
+    if len(correct) > 1:
+        return Verification("multiple_correct", correct)
+    if unparsed:
+        return Verification("unverifiable", reason="no option matched and some were not parseable")
+    return Verification("no_correct", reason="no option matches the computed answer")
+
+def repair(question: "QuizQuestion") -> "QuizQuestion | None":
+    # Keeps verified / unverifiable items, fixes a wrong key, drops the rest
+    result = verify(question)
+    if result.status == "wrong_key":
+        return question.model_copy(update={"answer_index": result.correct[0]})
+    return None if result.flagged else question
+
+# -----------------------------
+# 5️⃣ Batch mode
+# -----------------------------
+def _questions_from_jsonl(path: str):
+    from quiz_bank import QuizQuestion
+    # quiz_batch.py output ({"questions": [...]}) or one question per line
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            for n, q in enumerate(record.get("questions", [record])):
+                yield f"{record.get('job_id', f'line{line_no}')}#{n}", QuizQuestion.model_validate(q)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Verify multiple-choice answer keys locally")
+    parser.add_argument("files", nargs="*", help="JSONL files from quiz_batch.py or one question per line")
+    parser.add_argument("--bank", action="store_true", help="check the quiz bank (QUIZ_BANK_DB)")
+    parser.add_argument("--fix", action="store_true", help="with --bank: correct wrong keys, delete bad items")
+    parser.add_argument("--flagged", help="write flagged items to this JSONL file")
+    args = parser.parse_args()
+
+    counts: dict[str, int] = {}
+    flagged = []
+    fixes: dict = {}
+    items = (item for path in args.files for item in _questions_from_jsonl(path))
+    if args.bank:
+        from quiz_bank import quiz_bank
+        items = ((qid, q) for qid, _, _, q in quiz_bank.items())
+
+    for item_id, question in items:
+        result = verify(question)
+        counts[result.status] = counts.get(result.status, 0) + 1
+        if result.flagged:
+            flagged.append({"id": item_id, "status": result.status, "correct": result.correct,
+                            "reason": result.reason, **question.model_dump()})
+            fixes[item_id] = repair(question)
+
+    if args.flagged:
+        with open(args.flagged, "w", encoding="utf-8") as out:
+            out.writelines(json.dumps(f) + "\n" for f in flagged)
+    if args.bank and args.fix:
+        from quiz_bank import quiz_bank
+        for qid, fixed in fixes.items():
+            quiz_bank.replace(qid, fixed)
+    print(json.dumps({"checked": sum(counts.values()), **counts, "fixed": len(fixes) if args.fix else 0}))
+    sys.exit(1 if flagged and not args.fix else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+# app.py
+# One Chainlit process hosting every assistant as a chat profile:
+#
+#   chainlit run app.py
+#
+# Only chainlit is imported up front. An assistant's module (its agents,
+# guardrails and the shared Gemini model) is imported the first time a chat
+# picks its profile; its @cl.on_* handlers are captured during that import
+# instead of being registered globally, and this module routes each chat to
+# the handlers of its profile. `python app.py --profile-imports` reports
+# what each assistant costs to import and keep in memory.
+import time
+_process_started = time.perf_counter()
+
+import os
+import sys
+import json
+import asyncio
+import logging
+import argparse
+import threading
+import importlib
+import subprocess
+from dataclasses import dataclass, field
+from typing import Any, Callable
+import chainlit as cl
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# 1️⃣ Hosted assistants
+# -----------------------------
+# Seconds one assistant may take to import and start before a warning
+COLD_START_BUDGET = float(os.getenv("COLD_START_BUDGET", "3"))
+# Comma-separated modules initialised at startup instead of on first use
+PRELOAD_APPS = [name.strip() for name in os.getenv("PRELOAD_APPS", "").split(",") if name.strip()]
+
+_host_ready: float | None = None   # perf_counter() when the host finished starting
+
+HOOKS = ("on_app_startup", "on_app_shutdown", "on_chat_start", "on_chat_end", "on_message")
+# The cl.on_* swap below is process-global: two profiles importing at once
+# in two worker threads must not interleave it
+_import_lock = threading.Lock()
+
+@dataclass
+class HostedApp:
+    profile: str
+    module: str
+    description: str
+    handlers: dict[str, Callable] = field(default_factory=dict)
+    import_seconds: float | None = None
+    startup_seconds: float | None = None
+    _lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    @property
+    def loaded(self) -> bool:
+        return self.import_seconds is not None
+
+    async def load(self) -> "HostedApp":
+        async with self._lock:
+            if self.loaded:
+                return self
+            start = time.perf_counter()
+            # Imports run off the event loop so other chats keep streaming
+            self.handlers = await asyncio.to_thread(_import_capturing, self.module)
+            self.import_seconds = time.perf_counter() - start
+            if "on_app_startup" in self.handlers:
+                await self.handlers["on_app_startup"]()
+            self.startup_seconds = time.perf_counter() - start - self.import_seconds
+            _report_cold_start(self)
+        return self
+
+    async def call(self, hook: str, *args: Any) -> None:
+        handler = self.handlers.get(hook)
+        if handler is not None:
+            await handler(*args)
+
+APPS = {
+    app.profile: app
+    for app in (
+        HostedApp("Quiz", "generate_quiz", "Math quizzes and homework help."),
+        HostedApp("Guarded Quiz", "hw_quiz", "Math quizzes with homework and math-content guardrails."),
+        HostedApp("Homework Detector", "math_hw_detection", "Tells whether a message is a math homework request."),
+        HostedApp("Safe Homework Detector", "math_hw_detection_1", "Homework detection that never hands out solutions."),
+        HostedApp("Multi-Agent Research", "multi_agent_collab", "Research, summary and plan from three collaborating agents."),
+    )
+}
+
+def _import_capturing(module: str) -> dict[str, Callable]:
+    # The app modules decorate their handlers with @cl.on_message etc. at
+    # import time; while importing, those decorators only record the handler
+    if module in sys.modules:
+        raise RuntimeError(f"{module} was imported before app.py could capture its handlers")
+    handlers: dict[str, Callable] = {}
+
+    def capture(hook: str):
+        def register(func):
+            handlers[hook] = func
+            return func
+        return register
+
+    with _import_lock:
+        originals = {hook: getattr(cl, hook) for hook in HOOKS}
+        try:
+            for hook in HOOKS:
+                setattr(cl, hook, capture(hook))
+            importlib.import_module(module)
+        finally:
+            for hook, original in originals.items():
+                setattr(cl, hook, original)
+    return handlers
+
+def _report_cold_start(app: HostedApp) -> None:
+    total = app.import_seconds + app.startup_seconds
+    from metrics import metrics   # imported with the first assistant, not before
+    metrics.observe("app_init_seconds", total, app=app.module)
+    if total > COLD_START_BUDGET:
+        logger.warning("%s cold start took %.2fs (import %.2fs, startup %.2fs), budget is %.1fs",
+                       app.module, total, app.import_seconds, app.startup_seconds, COLD_START_BUDGET)
+    else:
+        logger.info("%s ready in %.2fs (import %.2fs, startup %.2fs)",
+                    app.module, total, app.import_seconds, app.startup_seconds)
+
+def cold_start_report() -> dict[str, Any]:
+    return {
+        "host_ready_s": round(_host_ready - _process_started, 3) if _host_ready else None,
+        "budget_s": COLD_START_BUDGET,
+        "apps": {
+            app.module: {
+                "import_s": round(app.import_seconds, 3),
+                "startup_s": round(app.startup_seconds, 3),
+                "over_budget": app.import_seconds + app.startup_seconds > COLD_START_BUDGET,
+            }
+            for app in APPS.values() if app.loaded
+        },
+    }
+
+def _current_app() -> HostedApp:
+    return APPS.get(cl.user_session.get("chat_profile"), next(iter(APPS.values())))
+
+# -----------------------------
+# 2️⃣ Chainlit hooks – route to the chat's profile
+# -----------------------------
+@cl.set_chat_profiles
+async def chat_profiles(user=None):
+    return [
+        cl.ChatProfile(name=app.profile, markdown_description=app.description, default=i == 0)
+        for i, app in enumerate(APPS.values())
+    ]
+
+@cl.on_app_startup
+async def handle_app_startup():
+    global _host_ready
+    _host_ready = time.perf_counter()
+    logger.info("Host ready in %.2fs", _host_ready - _process_started)
+    for module in PRELOAD_APPS:
+        app = next((a for a in APPS.values() if a.module == module), None)
+        if app is None:
+            logger.warning("PRELOAD_APPS: unknown assistant %r", module)
+            continue
+        await app.load()
+
+@cl.on_app_shutdown
+async def handle_app_shutdown():
+    loaded = [app for app in APPS.values() if app.loaded]
+    if not loaded:
+        return
+    # Each assistant's own hook also stops metrics and closes the shared
+    # Gemini client, which would cut off the assistants shut down after it
+    # (e.g. hw_quiz draining its pending audits). Those two run once, last.
+    import metrics
+    import gemini_provider
+    shared = {(metrics, "stop"): metrics.stop, (gemini_provider, "close"): gemini_provider.close}
+
+    async def later():
+        pass
+
+    try:
+        for module, name in shared:
+            setattr(module, name, later)
+        for app in loaded:
+            try:
+                await app.call("on_app_shutdown")
+            except Exception:
+                logger.exception("%s shutdown failed", app.module)
+    finally:
+        for (module, name), original in shared.items():
+            setattr(module, name, original)
+    await metrics.stop()
+    await gemini_provider.close()
+
+@cl.on_chat_start
+async def handle_chat_start():
+    # First chat on a profile pays for loading its assistant
+    app = await _current_app().load()
+    await app.call("on_chat_start")
+
+@cl.on_chat_end
+async def handle_chat_end():
+    app = _current_app()
+    if app.loaded:
+        await app.call("on_chat_end")
+
+@cl.on_message
+async def handle_message(message: cl.Message):
+    app = await _current_app().load()
+    await app.call("on_message", message)
+
+# -----------------------------
+# 3️⃣ Import-time profiling report
+# -----------------------------
+def _rss_mb() -> float:
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # Linux reports KiB
+
+def _profile_step() -> None:
+    # Child process: import chainlit, then each assistant in order, printing
+    # the peak RSS after every step (the stderr carries -X importtime)
+    os.environ.setdefault("GOOGLE_API_KEY", "import-profile")
+    for module in ["chainlit", *sys.argv[2:]]:
+        __import__(module)   # importlib.import_module() is not timed by -X importtime
+        print(json.dumps({"module": module, "rss_mb": round(_rss_mb(), 1)}), flush=True)
+
+def profile_imports(modules: list[str], top: int) -> dict[str, Any]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", __file__, "--profile-step", *modules],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    rss = {row["module"]: row["rss_mb"] for row in map(json.loads, proc.stdout.splitlines())}
+
+    # Lines look like "import time:  self [us] | cumulative | <indent>package";
+    # an unindented package was imported directly by the step above
+    steps: dict[str, float] = {}
+    packages: dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        root = name.strip().split(".")[0]
+        packages[root] = packages.get(root, 0) + int(self_us) / 1e6
+        if not name[1:].startswith(" ") and name.strip() in ("chainlit", *modules):
+            steps[name.strip()] = int(cumulative_us) / 1e6
+
+    previous = 0.0
+    report: dict[str, Any] = {"steps": [], "top_packages": []}
+    for module in ["chainlit", *modules]:
+        report["steps"].append({
+            "module": module,
+            "import_s": round(steps.get(module, 0.0), 3),   # only what was not imported before
+            "rss_mb": rss.get(module),
+            "rss_added_mb": round(rss.get(module, 0) - previous, 1),
+        })
+        previous = rss.get(module, previous)
+    for root, seconds in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        report["top_packages"].append({"package": root, "import_s": round(seconds, 3)})
+    return report
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "--profile-step":
+        _profile_step()
+        return
+    parser = argparse.ArgumentParser(description="Import-time and memory profile of the hosted assistants")
+    parser.add_argument("--profile-imports", action="store_true", help="import every assistant in a child process and report")
+    parser.add_argument("--apps", nargs="*", default=[app.module for app in APPS.values()], help="modules, in load order")
+    parser.add_argument("--top", type=int, default=15, help="heaviest packages to list")
+    args = parser.parse_args()
+    if not args.profile_imports:
+        parser.error("start the server with `chainlit run app.py`; this CLI only has --profile-imports")
+    report = profile_imports(args.apps, args.top)
+    for step in report["steps"]:
+        print(f"{step['module']:<22} import {step['import_s'] * 1000:8.0f} ms   "
+              f"rss {step['rss_mb']:7.1f} MB (+{step['rss_added_mb']:.1f})")
+    print("\nheaviest packages (self time):")
+    for row in report["top_packages"]:
+        print(f"  {row['package']:<28} {row['import_s'] * 1000:8.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+# benchmarks/bench_handlers.py
+# Offline load test for the Chainlit apps: swaps the Gemini model for
+# StubModel, drives N concurrent simulated sessions through each app's
+# @cl.on_message handler and reports latency / throughput / LLM calls.
+#
+#   python -m benchmarks.bench_handlers --sessions 50 --messages 3
+#   python -m benchmarks.bench_handlers --app hw_quiz --latency 0.5 --tps 80 --json bench.jsonl
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass, asdict
+
+from agents import set_tracing_disabled
+
+import call_budget
+
+from benchmarks import fake_chainlit
+from benchmarks.stub_model import StubModel, StubSettings, calls_var
+
+# -----------------------------
+# 1️⃣ Apps & sample prompts
+# -----------------------------
+QUIZ_PROMPTS = [
+    "Give me a quiz on algebra",
+    "Create 3 geometry questions for grade 8",
+    "Help me understand fractions",
+]
+HOMEWORK_PROMPTS = [
+    "Hi, who built you?",
+    "Can you explain what a prime number is?",
+    "solve for x: 2x + 3 = 11",
+]
+RESEARCH_PROMPTS = [
+    "How do I start learning machine learning?",
+    "Plan a week of healthy meals",
+    "What is the history of the printing press?",
+]
+
+APPS = {
+    "generate_quiz": QUIZ_PROMPTS,
+    "hw_quiz": QUIZ_PROMPTS,
+    "math_hw_detection": HOMEWORK_PROMPTS,
+    "math_hw_detection_1": HOMEWORK_PROMPTS,
+    "multi_agent_collab": RESEARCH_PROMPTS,
+}
+
+# -----------------------------
+# 2️⃣ Results
+# -----------------------------
+@dataclass
+class MessageSample:
+    latency: float
+    ttft: float | None
+    llm_calls: int
+    background_calls: int = 0
+    error: str | None = None
+
+@dataclass
+class AppReport:
+    app: str
+    sessions: int
+    messages: int
+    errors: int
+    wall_time: float
+    throughput: float
+    p50: float
+    p95: float
+    p99: float
+    ttft_p50: float | None
+    ttft_p95: float | None
+    calls_per_message: float
+    max_calls_per_message: int
+    background_calls: int
+
+def percentile(values: list[float], pct: float) -> float:
+    # Nearest-rank percentile; fine for benchmark-sized samples
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+def summarize(app: str, sessions: int, samples: list[MessageSample], wall_time: float) -> AppReport:
+    latencies = [s.latency for s in samples]
+    ttfts = [s.ttft for s in samples if s.ttft is not None]
+    calls = [s.llm_calls for s in samples]
+    background = sum(s.background_calls for s in samples)
+    return AppReport(
+        app=app,
+        sessions=sessions,
+        messages=len(samples),
+        errors=sum(1 for s in samples if s.error),
+        wall_time=wall_time,
+        throughput=len(samples) / wall_time if wall_time else 0.0,
+        p50=percentile(latencies, 50),
+        p95=percentile(latencies, 95),
+        p99=percentile(latencies, 99),
+        ttft_p50=percentile(ttfts, 50) if ttfts else None,
+        ttft_p95=percentile(ttfts, 95) if ttfts else None,
+        calls_per_message=sum(calls) / len(calls),
+        max_calls_per_message=max(calls),
+        background_calls=background,
+    )
+
+# -----------------------------
+# 3️⃣ Simulated sessions
+# -----------------------------
+async def run_session(app_name: str, prompts: list[str], messages: int) -> list[MessageSample]:
+    state = fake_chainlit.SessionState()
+    fake_chainlit.session_var.set(state)
+    hooks = fake_chainlit.handlers[app_name]
+    if "on_chat_start" in hooks:
+        await hooks["on_chat_start"]()
+
+    samples = []
+    for i in range(messages):
+        calls: list[str] = []
+        token = calls_var.set(calls)
+        state.first_output_at = None
+        error = None
+        start = time.perf_counter()
+        try:
+            await hooks["on_message"](fake_chainlit.Message(content=prompts[i % len(prompts)]))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        end = time.perf_counter()
+        calls_var.reset(token)
+        ttft = state.first_output_at - start if state.first_output_at is not None else None
+        foreground = sum(1 for kind in calls if kind != "background")
+        samples.append(MessageSample(
+            latency=end - start,
+            ttft=ttft,
+            llm_calls=foreground,
+            background_calls=len(calls) - foreground,
+            error=error,
+        ))
+    return samples
+
+async def bench_app(app_name: str, sessions: int, messages: int) -> tuple[AppReport, list[MessageSample]]:
+    prompts = APPS[app_name]
+    start = time.perf_counter()
+    # Each gather() child runs in its own copied context, i.e. its own session
+    results = await asyncio.gather(*(run_session(app_name, prompts, messages) for _ in range(sessions)))
+    wall_time = time.perf_counter() - start
+    samples = [s for session in results for s in session]
+    return summarize(app_name, sessions, samples, wall_time), samples
+
+# -----------------------------
+# 4️⃣ Setup & CLI
+# -----------------------------
+def load_apps(names: list[str], settings: StubSettings) -> StubModel:
+    # Must happen before the apps import chainlit / gemini_provider
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    # Keep the quiz bank in memory so runs start from a known (empty) bank
+    os.environ.setdefault("QUIZ_BANK_DB", ":memory:")
+    fake_chainlit.install()
+    # Apps that skip run_config would otherwise try to export traces
+    set_tracing_disabled(True)
+    # Calls over a handler's @call_budget raise instead of only logging
+    call_budget.set_strict(True)
+    import gemini_provider
+    stub = StubModel(settings=settings)
+    gemini_provider.use_model(stub)
+    for name in names:
+        importlib.import_module(name)
+    return stub
+
+async def prefill_quiz_bank(names: list[str]) -> None:
+    # Stock every bucket to target through the first quiz app's agent
+    from quiz_bank import quiz_bank, generator_for, TOPICS, DIFFICULTIES
+    app = next((importlib.import_module(n) for n in names if hasattr(importlib.import_module(n), "agent_quiz")), None)
+    if app is None:
+        return
+    generator = generator_for(app.agent_quiz)
+    for topic in TOPICS:
+        for difficulty in DIFFICULTIES:
+            while quiz_bank.stock()[(topic, difficulty)] < quiz_bank.target:
+                await quiz_bank.refill(generator, topic, difficulty)
+
+def print_report(report: AppReport) -> None:
+    ttft = f"{report.ttft_p50 * 1000:7.0f} / {report.ttft_p95 * 1000:7.0f}" if report.ttft_p50 is not None else "      n/a"
+    print(
+        f"{report.app:<22} msgs={report.messages:<5} err={report.errors:<3} "
+        f"thr={report.throughput:7.1f}/s  "
+        f"p50/p95/p99={report.p50 * 1000:6.0f}/{report.p95 * 1000:6.0f}/{report.p99 * 1000:6.0f} ms  "
+        f"ttft p50/p95={ttft} ms  "
+        f"calls/msg={report.calls_per_message:.2f} (max {report.max_calls_per_message})  "
+        f"bg calls={report.background_calls}"
+    )
+
+async def main_async(args: argparse.Namespace) -> int:
+    names = args.app or list(APPS)
+    settings = StubSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens_per_second=args.tps,
+        response_tokens=args.tokens,
+        chunk_tokens=args.chunk,
+        homework_rate=args.homework_rate,
+        math_rate=args.math_rate,
+    )
+    load_apps(names, settings)
+    if args.prefill_quiz_bank:
+        await prefill_quiz_bank(names)
+
+    failed = False
+    out = open(args.json, "a") if args.json else None
+    try:
+        for name in names:
+            report, samples = await bench_app(name, args.sessions, args.messages)
+            print_report(report)
+            for sample in samples:
+                if sample.error and args.verbose:
+                    print(f"  error: {sample.error}")
+            if args.verbose:
+                from scheduler import scheduler
+                print(f"  scheduler: {json.dumps(scheduler.snapshot())}")
+                import gemini_provider
+                for label, model in (("answer", gemini_provider.model), ("guardrail", gemini_provider.guardrail_model)):
+                    while not hasattr(model, "snapshot"):
+                        model = model.inner   # down to the ResilientModel
+                    print(f"  {label} calls: {json.dumps(model.snapshot())}")
+                from token_usage import ledger
+                print(f"  tokens: {json.dumps(ledger.snapshot())}")
+                batcher = getattr(sys.modules.get(name), "input_batcher", None)
+                if batcher is not None:
+                    print(f"  guardrail batches: {json.dumps(batcher.stats())}")
+                from semantic_cache import _caches
+                if name in _caches:
+                    print(f"  semantic cache: {json.dumps(_caches[name].stats())}")
+            if out:
+                out.write(json.dumps(asdict(report)) + "\n")
+            if args.metrics_jsonl:
+                # Histograms recorded by metrics.py during this app's run
+                from metrics import metrics
+                metrics.dump_jsonl(args.metrics_jsonl)
+                metrics.reset()
+            # Gate on --max-calls, or on the budget the handler declares itself
+            limit = args.max_calls
+            if limit is None:
+                limit = getattr(fake_chainlit.handlers[name]["on_message"], "max_llm_calls", None)
+            if report.errors or (limit is not None and report.max_calls_per_message > limit):
+                print(f"  FAIL: {name} made up to {report.max_calls_per_message} LLM calls per message "
+                      f"(limit {limit}), {report.errors} handler errors")
+                failed = True
+    finally:
+        if out:
+            out.close()
+    return 1 if failed else 0
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline latency benchmark for the Chainlit handlers")
+    parser.add_argument("--app", action="append", choices=list(APPS), help="app to benchmark (repeatable, default: all)")
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent simulated sessions")
+    parser.add_argument("--messages", type=int, default=3, help="messages per session")
+    parser.add_argument("--latency", type=float, default=0.3, help="stub time to first token (s)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="latency jitter as a fraction")
+    parser.add_argument("--tps", type=float, default=150.0, help="stub tokens per second")
+    parser.add_argument("--tokens", type=int, default=60, help="tokens per stub answer")
+    parser.add_argument("--chunk", type=int, default=3, help="tokens per streamed delta")
+    parser.add_argument("--homework-rate", type=float, default=0.0, help="fraction of inputs flagged as homework")
+    parser.add_argument("--math-rate", type=float, default=0.0, help="fraction of outputs flagged as math")
+    parser.add_argument("--prefill-quiz-bank", action="store_true", help="stock the quiz bank before the run")
+    parser.add_argument("--max-calls", type=int, default=None, help="fail if any message exceeds this many LLM calls (default: handler @call_budget)")
+    parser.add_argument("--json", help="append one JSON report line per app to this file")
+    parser.add_argument("--metrics-jsonl", help="append each app's instrumentation histograms (metrics.py) to this file")
+    parser.add_argument("--verbose", action="store_true", help="print handler errors")
+    sys.exit(asyncio.run(main_async(parser.parse_args())))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# benchmarks/fake_chainlit.py
+# Minimal in-process stand-in for the parts of `chainlit` the apps use, so the
+# @cl.on_message handlers can be driven without a browser or a server.
+import sys
+import time
+import types
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+# -----------------------------
+# 1️⃣ Per-session state
+# -----------------------------
+@dataclass
+class SessionState:
+    # Chainlit puts the session id under "id"
+    data: dict = field(default_factory=lambda: {"id": uuid.uuid4().hex})
+    messages: list = field(default_factory=list)
+    first_output_at: float | None = None   # perf_counter() of first visible text
+
+    def mark_output(self, text: str) -> None:
+        if text and self.first_output_at is None:
+            self.first_output_at = time.perf_counter()
+
+session_var: ContextVar[SessionState] = ContextVar("fake_chainlit_session")
+
+class UserSession:
+    def get(self, key, default=None):
+        return session_var.get().data.get(key, default)
+
+    def set(self, key, value):
+        session_var.get().data[key] = value
+
+# -----------------------------
+# 2️⃣ Message – records what the user would see
+# -----------------------------
+class Message:
+    def __init__(self, content: str = "", author: str | None = None, **kwargs):
+        self.id = str(uuid.uuid4())
+        self.content = content
+        self.author = author
+        self.removed = False
+
+    async def send(self):
+        state = session_var.get()
+        state.messages.append(self)
+        state.mark_output(self.content)
+        return self
+
+    async def stream_token(self, token: str, is_sequence: bool = False):
+        session_var.get().mark_output(token)
+        self.content = token if is_sequence else self.content + token
+
+    async def update(self):
+        session_var.get().mark_output(self.content)
+        return True
+
+    async def remove(self):
+        self.removed = True
+        return True
+
+@dataclass
+class ChatProfile:
+    name: str
+    markdown_description: str
+    icon: str | None = None
+    default: bool = False
+
+# -----------------------------
+# 3️⃣ Module installation
+# -----------------------------
+# Registered hooks per app module: handlers["hw_quiz"]["on_message"] -> func
+handlers: dict[str, dict[str, object]] = {}
+
+def _hook(name: str):
+    def decorator(func=None, *args, **kwargs):
+        # Works both as @cl.on_message and as @cl.set_chat_profiles(...)
+        def register(f):
+            handlers.setdefault(f.__module__, {})[name] = f
+            return f
+        return register(func) if callable(func) else register
+    return decorator
+
+def install() -> types.ModuleType:
+    module = types.ModuleType("chainlit")
+    module.Message = Message
+    module.ChatProfile = ChatProfile
+    module.user_session = UserSession()
+    for name in (
+        "on_chat_start", "on_message", "on_chat_end", "on_stop",
+        "on_app_startup", "on_app_shutdown", "set_chat_profiles", "set_starters",
+    ):
+        setattr(module, name, _hook(name))
+    sys.modules["chainlit"] = module
+    return module
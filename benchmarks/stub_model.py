@@ -0,0 +1,262 @@
+# benchmarks/stub_model.py
+# Local stand-in for OpenAIChatCompletionsModel: no network, configurable
+# latency / token rate, streamed deltas and canned structured outputs.
+import asyncio
+import json
+import random
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable
+
+from openai.types.responses import (
+    Response,
+    ResponseCompletedEvent,
+    ResponseContentPartAddedEvent,
+    ResponseCreatedEvent,
+    ResponseOutputItemAddedEvent,
+    ResponseOutputItemDoneEvent,
+    ResponseOutputMessage,
+    ResponseOutputText,
+    ResponseTextDeltaEvent,
+    ResponseUsage,
+)
+from openai.types.responses.response_usage import InputTokensDetails, OutputTokensDetails
+from agents import Model, ModelResponse, Usage
+from agents.agent_output import AgentOutputSchemaBase
+from agents.models.fake_id import FAKE_RESPONSES_ID
+
+import call_budget
+
+# -----------------------------
+# 1️⃣ Settings & canned outputs
+# -----------------------------
+LOREM = (
+    "To solve a linear equation isolate the variable by undoing each operation in reverse order "
+    "then check the result by substituting it back into the original equation "
+    "geometry questions usually start from a labelled sketch of the figure and the known angles"
+).split()
+
+@dataclass
+class StubSettings:
+    latency: float = 0.3          # seconds before the first token
+    jitter: float = 0.1           # +/- fraction applied to latency
+    tokens_per_second: float = 150.0
+    response_tokens: int = 60     # length of plain-text / `response` answers
+    chunk_tokens: int = 3         # tokens per streamed delta
+    homework_rate: float = 0.0    # probability MathHomeworkOutput trips the guardrail
+    math_rate: float = 0.0        # probability MathOutput trips the guardrail
+
+def _answer(settings: StubSettings) -> str:
+    return " ".join(LOREM[i % len(LOREM)] for i in range(settings.response_tokens))
+
+def _quiz_batch(settings: StubSettings, count: int = 6) -> dict[str, Any]:
+    questions = []
+    for _ in range(count):
+        a, b = random.randint(2, 99), random.randint(2, 99)
+        options = [a + b, a + b + 1, a + b - 1, a + b + 10]
+        random.shuffle(options)
+        questions.append({
+            "question": f"What is {a} + {b}?",
+            "options": [str(o) for o in options],
+            "answer_index": options.index(a + b),
+        })
+    return {"questions": questions}
+
+def _batch_ids(input: Any) -> list[int]:
+    # Batched prompts are a JSON list with one {"id", "message"} per input
+    text = input if isinstance(input, str) else input[-1]["content"]
+    return [entry["id"] for entry in json.loads(text)]
+
+# Structured outputs keyed on the output_type class name used by the apps
+STRUCTURED_OUTPUTS: dict[str, Callable[[StubSettings], dict[str, Any]]] = {
+    "MathHomeworkOutput": lambda s: {
+        "is_math_homework": random.random() < s.homework_rate,
+        "reasoning": "stub verdict",
+    },
+    "MathOutput": lambda s: {
+        "reasoning": "stub verdict",
+        "is_math": random.random() < s.math_rate,
+    },
+    "MessageOutput": lambda s: {"response": _answer(s)},
+    "AgentOutput": lambda s: {"response": _answer(s)},
+    "CombinedOutput": lambda s: {
+        "is_math_homework": random.random() < s.homework_rate,
+        "is_math": random.random() < s.math_rate,
+        "response": _answer(s),
+    },
+    "QuizBatch": _quiz_batch,
+    # guardrail_batch.MicroBatcher: one verdict per message in the JSON list
+    "MathHomeworkOutputBatch": lambda s, input=None: {
+        "verdicts": [{"id": i, **STRUCTURED_OUTPUTS["MathHomeworkOutput"](s)} for i in _batch_ids(input)],
+    },
+    "ResearchTopics": lambda s: {"sub_topics": ["background", "key facts", "recent developments"]},
+}
+
+# -----------------------------
+# 2️⃣ Per-session call counter
+# -----------------------------
+# The benchmark sets a fresh list per simulated message; guardrail tasks
+# spawned by the Runner copy the context, so they count into the same list.
+calls_var: ContextVar[list[str] | None] = ContextVar("stub_calls", default=None)
+
+def _record_call(kind: str) -> None:
+    calls = calls_var.get()
+    if calls is not None:
+        # Work started with call_budget.background_task() runs outside the
+        # handler's budget and is reported separately
+        calls.append(kind if call_budget.current_budget() is not None else "background")
+
+# -----------------------------
+# 3️⃣ Stub model
+# -----------------------------
+@dataclass
+class StubModel(Model):
+    settings: StubSettings = field(default_factory=StubSettings)
+    model: str = "stub-model"
+    total_calls: int = 0
+
+    def _render(self, output_schema: AgentOutputSchemaBase | None, input: Any = None) -> str:
+        if output_schema is None or output_schema.is_plain_text():
+            return _answer(self.settings)
+        builder = STRUCTURED_OUTPUTS.get(output_schema.name())
+        if builder is None:
+            raise KeyError(f"StubModel has no canned output for {output_schema.name()}")
+        if output_schema.name().endswith("OutputBatch"):
+            return json.dumps(builder(self.settings, input))
+        return json.dumps(builder(self.settings))
+
+    def _usage(self, input: Any, text: str) -> Usage:
+        # Rough 4-chars-per-token estimate, good enough for relative numbers
+        input_tokens = len(json.dumps(input, default=str)) // 4
+        output_tokens = max(1, len(text) // 4)
+        return Usage(
+            requests=1,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            total_tokens=input_tokens + output_tokens,
+        )
+
+    async def _first_token_delay(self) -> None:
+        spread = self.settings.latency * self.settings.jitter
+        await asyncio.sleep(max(0.0, self.settings.latency + random.uniform(-spread, spread)))
+
+    def _chunks(self, text: str) -> list[str]:
+        # Split on spaces but keep them, so the deltas join back to `text`
+        words = text.split(" ")
+        size = max(1, self.settings.chunk_tokens)
+        pieces = [" ".join(words[i:i + size]) for i in range(0, len(words), size)]
+        return [p + (" " if i < len(pieces) - 1 else "") for i, p in enumerate(pieces)]
+
+    def _message(self, text: str) -> ResponseOutputMessage:
+        return ResponseOutputMessage(
+            id=FAKE_RESPONSES_ID,
+            content=[ResponseOutputText(text=text, type="output_text", annotations=[])],
+            role="assistant",
+            status="completed",
+            type="message",
+        )
+
+    async def get_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        *,
+        previous_response_id=None,
+        prompt=None,
+    ) -> ModelResponse:
+        self.total_calls += 1
+        _record_call("get_response")
+        text = self._render(output_schema, input)
+        await self._first_token_delay()
+        await asyncio.sleep(len(text.split(" ")) / self.settings.tokens_per_second)
+        return ModelResponse(
+            output=[self._message(text)],
+            usage=self._usage(input, text),
+            response_id=None,
+        )
+
+    async def stream_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        *,
+        previous_response_id=None,
+        prompt=None,
+    ) -> AsyncIterator:
+        self.total_calls += 1
+        _record_call("stream_response")
+        text = self._render(output_schema, input)
+        usage = self._usage(input, text)
+        response = Response(
+            id=FAKE_RESPONSES_ID,
+            created_at=time.time(),
+            model=self.model,
+            object="response",
+            output=[],
+            tool_choice="auto",
+            tools=[],
+            parallel_tool_calls=False,
+        )
+        seq = 0
+
+        def next_seq() -> int:
+            nonlocal seq
+            seq += 1
+            return seq - 1
+
+        yield ResponseCreatedEvent(response=response, type="response.created", sequence_number=next_seq())
+        await self._first_token_delay()
+
+        pending = ResponseOutputMessage(
+            id=FAKE_RESPONSES_ID, content=[], role="assistant", status="in_progress", type="message"
+        )
+        yield ResponseOutputItemAddedEvent(
+            item=pending, output_index=0, type="response.output_item.added", sequence_number=next_seq()
+        )
+        yield ResponseContentPartAddedEvent(
+            content_index=0,
+            item_id=FAKE_RESPONSES_ID,
+            output_index=0,
+            part=ResponseOutputText(text="", type="output_text", annotations=[]),
+            type="response.content_part.added",
+            sequence_number=next_seq(),
+        )
+
+        delay = self.settings.chunk_tokens / self.settings.tokens_per_second
+        for chunk in self._chunks(text):
+            await asyncio.sleep(delay)
+            yield ResponseTextDeltaEvent(
+                content_index=0,
+                delta=chunk,
+                item_id=FAKE_RESPONSES_ID,
+                output_index=0,
+                logprobs=[],
+                type="response.output_text.delta",
+                sequence_number=next_seq(),
+            )
+
+        message = self._message(text)
+        yield ResponseOutputItemDoneEvent(
+            item=message, output_index=0, type="response.output_item.done", sequence_number=next_seq()
+        )
+        final = response.model_copy()
+        final.output = [message]
+        final.usage = ResponseUsage(
+            input_tokens=usage.input_tokens,
+            output_tokens=usage.output_tokens,
+            total_tokens=usage.total_tokens,
+            input_tokens_details=InputTokensDetails(cached_tokens=0),
+            output_tokens_details=OutputTokensDetails(reasoning_tokens=0),
+        )
+        yield ResponseCompletedEvent(response=final, type="response.completed", sequence_number=next_seq())
@@ -0,0 +1,98 @@
+# call_budget.py
+# Per-message LLM call budget. Handlers declare how many model calls one
+# message may cost (@call_budget(2)); every call made through the shared
+# model is counted against the budget of the handler that triggered it.
+import os
+import logging
+import asyncio
+import functools
+from contextvars import ContextVar, copy_context
+from dataclasses import dataclass
+from agents import Model
+
+logger = logging.getLogger(__name__)
+
+# Strict mode raises on the first call over budget (benchmarks / tests);
+# otherwise overruns are only logged so production traffic is never broken.
+STRICT = os.getenv("LLM_CALL_BUDGET_STRICT", "0") == "1"
+
+class CallBudgetExceeded(RuntimeError):
+    pass
+
+# -----------------------------
+# 1️⃣ Budget state
+# -----------------------------
+@dataclass
+class CallBudget:
+    name: str
+    max_calls: int
+    calls: int = 0
+
+    @property
+    def exceeded(self) -> bool:
+        return self.calls > self.max_calls
+
+# Guardrail tasks spawned by the Runner copy the context, so they share the
+# handler's CallBudget object and count into it.
+_budget_var: ContextVar[CallBudget | None] = ContextVar("llm_call_budget", default=None)
+
+def current_budget() -> CallBudget | None:
+    return _budget_var.get()
+
+def set_strict(strict: bool) -> None:
+    global STRICT
+    STRICT = strict
+
+def record_call() -> None:
+    budget = _budget_var.get()
+    if budget is None:
+        return
+    budget.calls += 1
+    if budget.exceeded and STRICT:
+        raise CallBudgetExceeded(
+            f"{budget.name} made {budget.calls} LLM calls, budget is {budget.max_calls}"
+        )
+
+def background_task(coro) -> asyncio.Task:
+    # Start work that outlives the handler (summaries, refills, audits) without
+    # charging its model calls to the current handler's budget
+    context = copy_context()
+    context.run(_budget_var.set, None)
+    return asyncio.create_task(coro, context=context)
+
+# -----------------------------
+# 2️⃣ Handler decorator
+# -----------------------------
+def call_budget(max_calls: int):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            budget = CallBudget(name=f"{func.__module__}.{func.__name__}", max_calls=max_calls)
+            token = _budget_var.set(budget)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _budget_var.reset(token)
+                if budget.exceeded:
+                    logger.warning(
+                        "%s made %d LLM calls, budget is %d", budget.name, budget.calls, budget.max_calls
+                    )
+        wrapper.max_llm_calls = max_calls
+        return wrapper
+    return decorator
+
+# -----------------------------
+# 3️⃣ Counting model wrapper
+# -----------------------------
+class BudgetedModel(Model):
+    def __init__(self, inner: Model):
+        self.inner = inner
+
+    async def get_response(self, *args, **kwargs):
+        record_call()
+        return await self.inner.get_response(*args, **kwargs)
+
+    async def stream_response(self, *args, **kwargs):
+        record_call()
+        async for event in self.inner.stream_response(*args, **kwargs):
+            yield event
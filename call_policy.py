@@ -0,0 +1,237 @@
+# call_policy.py
+# Deadlines, retries and hedging for model calls. Every call made through a
+# ResilientModel gets a per-attempt deadline, transient errors (timeouts,
+# 429s, 5xx, dropped connections) are retried with jittered exponential
+# backoff, and an optional hedge launches a duplicate request once the call
+# is slower than the observed p95: the first to finish wins, the other is
+# cancelled. Policies are per model, so guardrail agents and answer agents
+# are tuned separately.
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable
+import openai
+from agents import Model
+from scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# 1️⃣ Policies
+# -----------------------------
+@dataclass(frozen=True)
+class CallPolicy:
+    deadline: float | None = 60.0   # seconds per attempt (to the first event when streaming); None = no limit
+    retries: int = 1                # extra attempts after a transient error
+    backoff: float = 0.5            # base delay, doubled per retry and jittered
+    max_backoff: float = 8.0
+    hedge: bool = False             # duplicate calls slower than the observed p95
+    hedge_quantile: float = 0.95
+    hedge_min_delay: float = 0.2    # never hedge sooner than this
+    hedge_min_samples: int = 20     # latencies needed before hedging starts
+
+def policy_from_env(name: str, **defaults: Any) -> CallPolicy:
+    # CALL_<NAME>_DEADLINE / _RETRIES / _BACKOFF / _HEDGE override the defaults
+    base = CallPolicy(**defaults)
+    prefix = f"CALL_{name.upper()}_"
+    deadline = float(os.getenv(prefix + "DEADLINE", base.deadline or 0))
+    return CallPolicy(
+        deadline=deadline or None,
+        retries=int(os.getenv(prefix + "RETRIES", base.retries)),
+        backoff=float(os.getenv(prefix + "BACKOFF", base.backoff)),
+        max_backoff=base.max_backoff,
+        hedge=os.getenv(prefix + "HEDGE", "1" if base.hedge else "0") != "0",
+        hedge_quantile=base.hedge_quantile,
+        hedge_min_delay=base.hedge_min_delay,
+        hedge_min_samples=base.hedge_min_samples,
+    )
+
+# Short classifier calls gate every reply: tight deadline, more retries.
+# Answers may legitimately take a while to start; one retry is enough.
+POLICIES: dict[str, CallPolicy] = {
+    "guardrail": policy_from_env("guardrail", deadline=10.0, retries=2, backoff=0.25),
+    "answer": policy_from_env("answer", deadline=60.0, retries=1, backoff=0.5),
+}
+
+# -----------------------------
+# 2️⃣ Transient errors
+# -----------------------------
+TRANSIENT_ERRORS = (
+    TimeoutError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+def _retry_after(error: BaseException) -> float | None:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+def backoff_delay(policy: CallPolicy, attempt: int, error: BaseException | None = None) -> float:
+    # Full jitter keeps retries from many sessions from landing together;
+    # a server-provided Retry-After wins when it is longer
+    delay = random.uniform(0, min(policy.max_backoff, policy.backoff * 2 ** attempt))
+    return max(delay, _retry_after(error) or 0.0) if error is not None else delay
+
+# -----------------------------
+# 3️⃣ Latency tracking & stats
+# -----------------------------
+@dataclass
+class CallStats:
+    calls: int = 0
+    retries: int = 0
+    timeouts: int = 0
+    failures: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    recent: deque = field(default_factory=lambda: deque(maxlen=500))
+
+    def quantile(self, q: float) -> float | None:
+        if not self.recent:
+            return None
+        latencies = sorted(self.recent)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def summary(self) -> dict[str, Any]:
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "latency_p50_ms": round(1000 * p50, 1) if p50 is not None else None,
+            "latency_p95_ms": round(1000 * p95, 1) if p95 is not None else None,
+        }
+
+# -----------------------------
+# 4️⃣ Resilient model wrapper
+# -----------------------------
+class ResilientModel(Model):
+    # Sits outside ScheduledModel, so each retry and hedge is admitted (and
+    # rate limited) on its own, and inside BudgetedModel, so a handler's
+    # @call_budget counts one logical call however many attempts it took.
+    def __init__(self, inner: Model, policy: CallPolicy):
+        self.inner = inner
+        self.policy = policy
+        self.stats = CallStats()
+
+    def _hedge_delay(self) -> float | None:
+        if not self.policy.hedge or len(self.stats.recent) < self.policy.hedge_min_samples:
+            return None
+        return max(self.policy.hedge_min_delay, self.stats.quantile(self.policy.hedge_quantile))
+
+    def _can_hedge(self) -> bool:
+        # Hedges only use spare capacity: never while calls are queueing
+        return scheduler.queued == 0 and scheduler.in_flight < scheduler.max_concurrency
+
+    async def _attempt(self, call: Callable[[], Awaitable[Any]], discard: Callable[[Any], Awaitable[Any]] | None = None) -> Any:
+        # One attempt: the primary call plus at most one hedge, within the deadline
+        start = time.monotonic()
+        hedge_after = self._hedge_delay()
+        tasks = [asyncio.ensure_future(call())]
+        winner = None
+        try:
+            async with asyncio.timeout(self.policy.deadline):
+                pending = set(tasks)
+                while pending:
+                    done, pending = await asyncio.wait(pending, timeout=hedge_after, return_when=asyncio.FIRST_COMPLETED)
+                    if not done:
+                        # Slower than the observed p95: race a duplicate
+                        hedge_after = None
+                        if self._can_hedge():
+                            self.stats.hedges += 1
+                            tasks.append(asyncio.ensure_future(call()))
+                            pending.add(tasks[-1])
+                        continue
+                    for task in done:
+                        if task.exception() is None:
+                            winner = task
+                            break
+                    if winner is not None:
+                        break
+                    hedge_after = None
+        except TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            for task in tasks:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif discard is not None and not task.cancelled() and task.exception() is None:
+                    await discard(task.result())   # both finished at once
+        if winner is None:
+            raise tasks[0].exception()
+        if winner is not tasks[0]:
+            self.stats.hedge_wins += 1
+        self.stats.recent.append(time.monotonic() - start)
+        return winner.result()
+
+    async def _with_retries(self, call: Callable[[], Awaitable[Any]], discard: Callable[[Any], Awaitable[Any]] | None = None) -> Any:
+        self.stats.calls += 1
+        for attempt in range(self.policy.retries + 1):
+            try:
+                return await self._attempt(call, discard)
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.policy.retries:
+                    self.stats.failures += 1
+                    raise
+                self.stats.retries += 1
+                delay = backoff_delay(self.policy, attempt, e)
+                logger.info("Model call failed (%s), retry %d in %.2fs", type(e).__name__, attempt + 1, delay)
+                await asyncio.sleep(delay)
+
+    async def get_response(self, *args, **kwargs):
+        return await self._with_retries(lambda: self.inner.get_response(*args, **kwargs))
+
+    async def _open_stream(self, args, kwargs):
+        # Reads up to the first event that carries output; "response.created"
+        # alone does not show the model is making progress
+        stream = self.inner.stream_response(*args, **kwargs)
+        buffered = []
+        try:
+            async for event in stream:
+                buffered.append(event)
+                if event.type != "response.created":
+                    break
+        except BaseException:
+            await stream.aclose()
+            raise
+        return stream, buffered
+
+    async def stream_response(self, *args, **kwargs):
+        # Deadline, retries and hedging apply until the first output event;
+        # after that the stream is only bounded by the deadline between events,
+        # since text already shown to the user cannot be retried
+        discard = lambda opened: opened[0].aclose()
+        stream, buffered = await self._with_retries(lambda: self._open_stream(args, kwargs), discard)
+        try:
+            for event in buffered:
+                yield event
+            while True:
+                try:
+                    async with asyncio.timeout(self.policy.deadline):
+                        event = await anext(stream)
+                except StopAsyncIteration:
+                    return
+                except TimeoutError:
+                    self.stats.timeouts += 1
+                    raise
+                yield event
+        finally:
+            await stream.aclose()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {"policy": asdict(self.policy), **self.stats.summary()}
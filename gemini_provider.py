@@ -0,0 +1,153 @@
+# gemini_provider.py
+# Shared Gemini provider, model and RunConfig used by every assistant.
+# One pooled keep-alive HTTP client per process instead of one per app module.
+import os
+import asyncio
+import logging
+from dotenv import load_dotenv, find_dotenv
+from openai import DefaultAsyncHttpxClient
+import httpx
+from agents import (
+    Model,
+    RunConfig,
+    AsyncOpenAI,
+    OpenAIChatCompletionsModel,
+)
+from call_budget import BudgetedModel
+from call_policy import POLICIES, CallPolicy, ResilientModel
+from metrics import MeteredModel
+from scheduler import Priority, ScheduledModel
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# 1️⃣ Load API key & settings
+# -----------------------------
+load_dotenv(find_dotenv())
+gemini_api_key = os.getenv("GOOGLE_API_KEY")
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+POOL_MAX_CONNECTIONS = int(os.getenv("GEMINI_POOL_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE = int(os.getenv("GEMINI_POOL_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("GEMINI_POOL_KEEPALIVE_EXPIRY", "300"))
+WARM_CONNECTIONS = int(os.getenv("GEMINI_WARM_CONNECTIONS", "4"))
+WARM_TIMEOUT = float(os.getenv("GEMINI_WARM_TIMEOUT", "10"))
+
+# HTTP/2 needs the optional `h2` package (`pip install httpx[http2]`)
+try:
+    import h2  # noqa: F401
+    HTTP2_ENABLED = os.getenv("GEMINI_HTTP2", "1") != "0"
+except ImportError:
+    HTTP2_ENABLED = False
+
+# -----------------------------
+# 2️⃣ HTTP pool – tuned keep-alive connections
+# -----------------------------
+http_client = DefaultAsyncHttpxClient(
+    http2=HTTP2_ENABLED,
+    limits=httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+    ),
+    timeout=httpx.Timeout(60.0, connect=5.0),
+)
+
+# -----------------------------
+# 3️⃣ Provider – connection to Gemini API
+# -----------------------------
+# Retries are handled per call policy (call_policy.py), not by the client
+provider = AsyncOpenAI(
+    api_key=gemini_api_key,
+    base_url=GEMINI_BASE_URL,
+    http_client=http_client,
+    max_retries=0,
+)
+
+# -----------------------------
+# 4️⃣ Model – Gemini Chat Completion
+# -----------------------------
+# Every call is counted against the calling handler's @call_budget, timed
+# (metrics.py), gets the deadline / retry / hedging policy of its agent
+# (call_policy.py) and is admitted by the process-wide scheduler (scheduler.py)
+base_model: Model = OpenAIChatCompletionsModel(
+    model=GEMINI_MODEL,
+    openai_client=provider,
+)
+
+def model_for(policy: str | CallPolicy = "answer", priority: Priority | None = None, name: str | None = None) -> Model:
+    # An agent needing its own tuning passes e.g.
+    # model=model_for(CallPolicy(deadline=5, hedge=True), Priority.GUARDRAIL, name="fast_check")
+    # `name` labels the call metrics (metrics.py); defaults to the policy name
+    if isinstance(policy, str):
+        name = name or policy
+        policy = POLICIES[policy]
+    return BudgetedModel(MeteredModel(ResilientModel(ScheduledModel(base_model, priority), policy), name or "custom"))
+
+model = model_for("answer")
+# Same model, scheduled ahead of long generations with a tighter deadline: for guardrail agents
+guardrail_model = model_for("guardrail", Priority.GUARDRAIL)
+
+# -----------------------------
+# 5️⃣ RunConfig – run settings
+# -----------------------------
+run_config = RunConfig(
+    model=model,
+    model_provider=provider,
+    tracing_disabled=True
+)
+
+def use_model(new_base_model: Model) -> None:
+    # Swap the underlying model, e.g. for the offline stub in benchmarks/.
+    # Must run before the app modules do `from gemini_provider import model`.
+    global base_model, model, guardrail_model, run_config
+    base_model = new_base_model
+    model = model_for("answer")
+    guardrail_model = model_for("guardrail", Priority.GUARDRAIL)
+    run_config = RunConfig(
+        model=model,
+        model_provider=provider,
+        tracing_disabled=True
+    )
+
+# -----------------------------
+# 6️⃣ Warm-up & shutdown
+# -----------------------------
+_warm_lock = asyncio.Lock()
+_warmed = False
+
+async def _ping() -> None:
+    # Listing models is the cheapest authenticated round trip on the endpoint
+    await provider.models.list()
+
+async def warm_up(connections: int = WARM_CONNECTIONS) -> bool:
+    global _warmed
+    async with _warm_lock:
+        if _warmed:
+            return True
+        if not gemini_api_key:
+            logger.warning("GOOGLE_API_KEY is not set, skipping connection warm-up")
+            return False
+
+        # HTTP/2 multiplexes every request over one connection; HTTP/1.1 needs
+        # one open socket per concurrent request, so open several in parallel.
+        count = 1 if HTTP2_ENABLED else max(1, connections)
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(*(_ping() for _ in range(count)), return_exceptions=True),
+                timeout=WARM_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Gemini warm-up timed out after %.1fs", WARM_TIMEOUT)
+            return False
+
+        errors = [r for r in results if isinstance(r, Exception)]
+        for error in errors:
+            logger.warning("Gemini warm-up request failed: %s", error)
+        _warmed = len(errors) < count
+        return _warmed
+
+async def close() -> None:
+    await http_client.aclose()
@@ -1,10 +1,5 @@
-import os
 import chainlit as cl
 from agents import (
-    Agent, 
-    RunConfig, 
-    AsyncOpenAI,
-    OpenAIChatCompletionsModel, 
     Runner,
     GuardrailFunctionOutput,
     InputGuardrailTripwireTriggered,
@@ -14,93 +9,101 @@ from agents import (
     input_guardrail,
     output_guardrail,
     )
-from dotenv import load_dotenv, find_dotenv
+import gemini_provider
+from call_budget import call_budget
+from scheduler import on_busy
+import metrics
+from metrics import MeteredFlush, timed
+from token_usage import BUDGET_MESSAGE, EXHAUSTED, budget_level, for_budget, ledger, track_session
+from gemini_provider import run_config
+from history_manager import ConversationHistory
+from quiz_agent import agent_quiz   # the agent lives outside the UI module for quiz_batch.py
+from quiz_bank import quiz_bank, serve_quiz
 from openai.types.responses import ResponseTextDeltaEvent
 
 # -----------------------------
-# 1️⃣ Load API key
+# 1️⃣ Startup – warm Gemini connections before the first message
 # -----------------------------
-load_dotenv(find_dotenv())
-gemini_api_key = os.getenv("GOOGLE_API_KEY")
+@cl.on_app_startup
+async def handle_app_startup():
+    await gemini_provider.warm_up()
+    await metrics.start()
+    # Top up the quiz bank through the quiz agent whenever the app is quiet
+    quiz_bank.start_refill(agent_quiz)
 
-# -----------------------------
-# 2️⃣ Provider – connection to Gemini API
-# -----------------------------
-provider = AsyncOpenAI(
-    api_key=gemini_api_key,
-    base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
-)
-
-# -----------------------------
-# 3️⃣ Model – Gemini Chat Completion
-# -----------------------------
-model = OpenAIChatCompletionsModel(
-    model="gemini-2.5-flash",
-    openai_client=provider,
-)
+@cl.on_app_shutdown
+async def handle_app_shutdown():
+    quiz_bank.stop()
+    await metrics.stop()
+    await gemini_provider.close()
 
 # -----------------------------
-# 4️⃣ RunConfig – run settings
-# -----------------------------
-run_config = RunConfig(
-    model=model,
-    model_provider=provider,
-    tracing_disabled=True
-)
-
-
-
-# -----------------------------
-# 5️⃣ Agent – Math Quiz & Homework Generator
-# -----------------------------
-agent_quiz: Agent = Agent(
-    name="Math Quiz & Homework Generator",
-    instructions=(
-        "You are a math assistant. You can generate math quizzes or help with math homework. "
-        "If the user asks for a quiz, create 3 multiple-choice math questions with 4 options each and mark the correct answer. "
-        "If the user asks for homework help, solve the problem step by step clearly. "
-        "Topics include algebra, arithmetic, and geometry."
-    ),
-    model=model,
-)
-
-# -----------------------------
-# 6️⃣ Greeting when chat starts
+# 2️⃣ Greeting when chat starts
 # -----------------------------
 @cl.on_chat_start
 async def handle_chat_start():
     if cl.user_session.get("greeted"):
         return
     cl.user_session.set("greeted", True)
-    cl.user_session.set("history", [])
+    cl.user_session.set("history", ConversationHistory(cl.user_session.get("id")))
+    cl.user_session.set("quiz_seen", set())   # bank question ids shown in this chat
     await cl.Message(
         content="📐 **Welcome!** I am a Math Quiz & Homework Assistant 🤖 built by **Haseeb Ur Rehman**.\n\n"
                 "You can ask me to generate math quizzes or solve math homework problems!"
     ).send()
 
 # -----------------------------
-# 7️⃣ Handling user messages
+# 3️⃣ Chat end – free the session's history and token tally from RAM
+# -----------------------------
+@cl.on_chat_end
+async def handle_chat_end():
+    history = cl.user_session.get("history")
+    if history is not None:
+        history.release()
+    ledger.release(cl.user_session.get("id"))
+
+# -----------------------------
+# 4️⃣ Handling user messages
 # -----------------------------
 @cl.on_message
+@timed("handler_seconds", app="generate_quiz")
+@on_busy(lambda text: cl.Message(content=text).send())
+@call_budget(1)  # the quiz agent
+@track_session(lambda: cl.user_session.get("id"))
 async def handle_message(message: cl.Message):
     history = cl.user_session.get("history")
     msg = cl.Message(content="")
+    flush = MeteredFlush(msg.stream_token, app="generate_quiz")
     await msg.send()
 
-    # Save user input to history
+    # Save user input to history; the prompt is a summary of older turns
+    # plus the recent ones that fit the token budget
     history.append({"role": "user", "content": message.content})
 
+    # Plain quiz requests are served from the pre-generated bank
+    quiz = serve_quiz(message.content, cl.user_session.get("quiz_seen"))
+    if quiz is not None:
+        await flush(quiz)
+        history.append({"role": "assistant", "content": quiz})
+        return
+
+    # Past the chat's token budget only bank quizzes are served; close to it
+    # the agent is asked for shorter answers
+    if budget_level() == EXHAUSTED:
+        await flush(BUDGET_MESSAGE)
+        return
+
     # Run the math quiz/homework agent
     result = Runner.run_streamed(
-        agent_quiz,
-        input=history,
+        for_budget(agent_quiz),
+        input=history.prompt(),
         run_config=run_config,
     )
 
     # Stream the assistant response token by token
     async for event in result.stream_events():
         if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
-            await msg.stream_token(event.data.delta)
+            await flush(event.data.delta)
 
     # Save assistant output to history
     history.append({"role": "assistant", "content": result.final_output})
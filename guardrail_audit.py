@@ -0,0 +1,151 @@
+# guardrail_audit.py
+# Post-hoc output guardrails. Instead of holding the answer until a second
+# model call has checked it, the answer is delivered and a sampled share of
+# messages is checked in the background. Every audit is appended to a JSONL
+# audit log (unsampled messages are only counted); a violation redacts the
+# delivered message and flags the session, and flagged sessions go back to
+# inline checks for good. Flags are also kept in a small file of their own,
+# loaded at startup, so the audit log is never read back.
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+from call_budget import background_task
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# 1️⃣ Settings
+# -----------------------------
+AUDIT_LOG = os.getenv("AUDIT_LOG", "guardrail_audit.jsonl")
+AUDIT_FLAGS = os.getenv("AUDIT_FLAGS", "guardrail_flags.jsonl")   # flagged sessions
+AUDIT_SAMPLE_RATE = float(os.getenv("AUDIT_SAMPLE_RATE", "1.0"))   # tenants not listed below
+
+def _parse_rates(spec: str) -> dict[str, float]:
+    # "trusted=0.1,school=0.5" -> {"trusted": 0.1, "school": 0.5}
+    rates = {}
+    for part in spec.split(","):
+        if "=" in part:
+            tenant, rate = part.split("=", 1)
+            rates[tenant.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+AUDIT_TENANT_RATES = _parse_rates(os.getenv("AUDIT_TENANT_RATES", ""))
+AUDIT_DRAIN_TIMEOUT = float(os.getenv("AUDIT_DRAIN_TIMEOUT", "10"))
+
+REDACTED_MESSAGE = "⚠️ This answer was removed after review: it broke the assistant's content rules."
+
+# -----------------------------
+# 2️⃣ Append-only audit log
+# -----------------------------
+class AuditLog:
+    def __init__(self, path: str = AUDIT_LOG):
+        self.path = path
+        self._lock = asyncio.Lock()
+
+    async def append(self, record: dict[str, Any]) -> None:
+        line = json.dumps({"ts": time.time(), **record}) + "\n"
+        async with self._lock:
+            await asyncio.to_thread(self._write, line)
+
+    def _write(self, line: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def records(self) -> list[dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return []
+        rows = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    continue   # torn last line after a crash
+        return rows
+
+# -----------------------------
+# 3️⃣ Auditor
+# -----------------------------
+# check(text) -> (violated, detail); redact() edits the delivered message
+Check = Callable[[str], Awaitable[tuple[bool, str]]]
+
+class Auditor:
+    def __init__(self, log: AuditLog | None = None, default_rate: float = AUDIT_SAMPLE_RATE,
+                 tenant_rates: dict[str, float] | None = None, flags: AuditLog | None = None):
+        self.log = log or AuditLog()
+        self.flags = flags or AuditLog(AUDIT_FLAGS)
+        self.default_rate = default_rate
+        self.tenant_rates = AUDIT_TENANT_RATES if tenant_rates is None else tenant_rates
+        self._flagged: set[str] = set()
+        self._pending: set[asyncio.Task] = set()
+
+    def rate(self, tenant: str) -> float:
+        return self.tenant_rates.get(tenant, self.default_rate)
+
+    async def load(self) -> None:
+        # On startup: flags survive restarts
+        records = await asyncio.to_thread(self.flags.records)
+        self._flagged.update(r["session_id"] for r in records)
+
+    def is_flagged(self, session_id: str | None) -> bool:
+        return session_id in self._flagged
+
+    def submit(self, guardrail: str, check: Check, text: str, redact: Callable[[], Awaitable[Any]],
+               session_id: str | None, tenant: str, message_id: str | None = None) -> asyncio.Task | None:
+        # Called once the answer is delivered; returns the audit task, or
+        # None when the message was not sampled
+        if random.random() >= self.rate(tenant):
+            metrics.inc("guardrail_audits_total", guardrail=guardrail, tenant=tenant, outcome="skipped")
+            return None
+        record = {"guardrail": guardrail, "session_id": session_id, "tenant": tenant, "message_id": message_id}
+        task = background_task(self._audit(record, check, text, redact))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        return task
+
+    async def _audit(self, record: dict[str, Any], check: Check, text: str, redact: Callable[[], Awaitable[Any]]) -> None:
+        start = time.perf_counter()
+        try:
+            violated, detail = await check(text)
+        except Exception as e:
+            logger.warning("Audit of %s failed: %s", record["guardrail"], e)
+            metrics.inc("guardrail_audits_total", guardrail=record["guardrail"], tenant=record["tenant"], outcome="error")
+            await self.log.append({**record, "action": "error", "detail": str(e)})
+            return
+        delay = time.perf_counter() - start
+        metrics.observe("guardrail_audit_seconds", delay, guardrail=record["guardrail"])
+        outcome = "violation" if violated else "pass"
+        metrics.inc("guardrail_audits_total", guardrail=record["guardrail"], tenant=record["tenant"], outcome=outcome)
+        await self.log.append({**record, "action": outcome, "detail": detail, "check_seconds": round(delay, 3)})
+        if not violated:
+            return
+        try:
+            await redact()
+            await self.log.append({**record, "action": "redacted"})
+        except Exception as e:
+            logger.warning("Redacting message %s failed: %s", record["message_id"], e)
+        if record["session_id"] is not None and not self.is_flagged(record["session_id"]):
+            self._flagged.add(record["session_id"])
+            await self.flags.append({"session_id": record["session_id"]})
+            await self.log.append({**record, "action": "flagged"})
+
+    async def drain(self, timeout: float = AUDIT_DRAIN_TIMEOUT) -> None:
+        # On shutdown: let audits in flight reach the log
+        if self._pending:
+            await asyncio.wait(list(self._pending), timeout=timeout)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "flagged_sessions": len(self._flagged),
+            "default_rate": self.default_rate,
+            "tenant_rates": self.tenant_rates,
+        }
+
+# Shared process-wide auditor
+auditor = Auditor()
@@ -0,0 +1,137 @@
+# history_manager.py
+# Token-budgeted chat history: the prompt is a rolling summary of older turns
+# plus a sliding window of recent turns that fits HISTORY_TOKEN_BUDGET. Older
+# turns are summarized in the background, off the request path.
+import os
+import uuid
+import asyncio
+import logging
+from typing import Any
+from agents import Agent, Runner, TResponseInputItem
+from call_budget import background_task
+from gemini_provider import model
+from session_store import session_store
+from token_usage import usage_hooks
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# 1️⃣ Settings & token estimate
+# -----------------------------
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+# Never summarize away the newest turns, even if they exceed the budget
+HISTORY_MIN_RECENT = int(os.getenv("HISTORY_MIN_RECENT", "2"))
+# Upper bound on turns loaded from the session store to build one prompt
+HISTORY_MAX_WINDOW = int(os.getenv("HISTORY_MAX_WINDOW", "40"))
+
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English; cheap and close enough for budgeting
+    return MESSAGE_OVERHEAD_TOKENS + (len(text) + 3) // 4
+
+def _turn_text(turn: dict[str, Any]) -> str:
+    content = turn.get("content", "")
+    return content if isinstance(content, str) else str(content)
+
+# -----------------------------
+# 2️⃣ Summarizer agent
+# -----------------------------
+history_summarizer = Agent(
+    name="History Summarizer",
+    instructions=(
+        "Summarize the conversation so far in a few sentences for the assistant's own memory. "
+        "Keep facts, numbers, quiz topics, the user's level and any open questions; drop pleasantries."
+    ),
+    model=model,
+    # Charged to the chat: background_task keeps the session context
+    hooks=usage_hooks,
+)
+
+# -----------------------------
+# 3️⃣ Conversation history
+# -----------------------------
+class ConversationHistory:
+    # Turns live in the session store; this object only keeps the summary
+    def __init__(
+        self,
+        session_id: str | None = None,
+        store=None,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        min_recent: int = HISTORY_MIN_RECENT,
+    ):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.store = store if store is not None else session_store
+        self.token_budget = token_budget
+        self.min_recent = min_recent
+        self.summary = ""
+        self.summarized_upto = 0   # turns[:summarized_upto] are covered by `summary`
+        self._summary_task: asyncio.Task | None = None
+
+    def append(self, turn: dict[str, Any]) -> int:
+        # Returns the turn's index, for replace()
+        return self.store.append(self.session_id, turn)
+
+    def replace(self, index: int, turn: dict[str, Any]) -> None:
+        # E.g. a redacted answer: later prompts must not carry the original
+        self.store.replace(self.session_id, index, turn)
+        summarizing = self._summary_task is not None and not self._summary_task.done()
+        if index < self.summarized_upto or summarizing:
+            # The summary may quote it: rebuild it from the stored turns
+            if summarizing:
+                self._summary_task.cancel()
+            self.summary = ""
+            self.summarized_upto = 0
+
+    def __len__(self) -> int:
+        return self.store.length(self.session_id)
+
+    def prompt(self) -> list[TResponseInputItem]:
+        # Only the newest turns are loaded; the rest is in the summary
+        recent = self.store.tail(self.session_id, HISTORY_MAX_WINDOW)
+        offset = self.store.length(self.session_id) - len(recent)
+
+        # Newest turns first until the budget (minus the summary) is spent
+        budget = self.token_budget - (estimate_tokens(self.summary) if self.summary else 0)
+        start = len(recent)
+        used = 0
+        while start > 0:
+            cost = estimate_tokens(_turn_text(recent[start - 1]))
+            if used + cost > budget and len(recent) - start >= self.min_recent:
+                break
+            used += cost
+            start -= 1
+
+        # Turns that fell out of the window and are not in the summary yet
+        if offset + start > self.summarized_upto:
+            self._summarize_in_background(offset + start)
+
+        items: list[TResponseInputItem] = []
+        if self.summary:
+            items.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+        items.extend(recent[start:])
+        return items
+
+    def release(self) -> None:
+        # Chat ended: free the session's turns from RAM
+        self.store.release(self.session_id)
+
+    def _summarize_in_background(self, upto: int) -> None:
+        if self._summary_task is not None and not self._summary_task.done():
+            return  # the next prompt() picks up whatever is still missing
+        self._summary_task = background_task(self._summarize(upto))
+
+    async def _summarize(self, upto: int) -> None:
+        older = self.store.range(self.session_id, self.summarized_upto, upto)
+        transcript = "\n".join(f"{t.get('role')}: {_turn_text(t)}" for t in older)
+        prompt = (
+            f"Earlier summary:\n{self.summary or '(none)'}\n\n"
+            f"New turns:\n{transcript}"
+        )
+        try:
+            result = await Runner.run(history_summarizer, prompt)
+        except Exception as e:
+            logger.warning("History summary failed: %s", e)
+            return
+        self.summary = str(result.final_output)
+        self.summarized_upto = upto
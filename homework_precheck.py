@@ -0,0 +1,106 @@
+# homework_precheck.py
+# CPU-only first stage in front of the LLM homework guardrail. Scores an
+# input on equation / operator / phrasing features and decides obvious cases
+# locally; only ambiguous inputs are escalated to guardrail_input_agent.
+import os
+import re
+import math
+from dataclasses import dataclass
+from agents import TResponseInputItem
+from verdict_cache import input_text
+
+# -----------------------------
+# 1️⃣ Settings – confidence thresholds
+# -----------------------------
+PRECHECK_ENABLED = os.getenv("PRECHECK_ENABLED", "1") != "0"
+# Probability at or above which the input is homework without asking the LLM
+HOMEWORK_THRESHOLD = float(os.getenv("PRECHECK_HOMEWORK_THRESHOLD", "0.9"))
+# Probability at or below which the input is clean without asking the LLM
+CLEAN_THRESHOLD = float(os.getenv("PRECHECK_CLEAN_THRESHOLD", "0.1"))
+
+# -----------------------------
+# 2️⃣ Features – (name, pattern, log-odds weight)
+# -----------------------------
+BIAS = -1.0
+FEATURES = [
+    # Homework signals
+    ("equation", re.compile(r"=.*([a-z]\s*[\^+\-*/=)]|\d\s*[a-z]\b)|(\d\s*[a-z]\b|\b[a-z]\s*[\^+\-*/]).*="), 3.0),
+    ("arithmetic", re.compile(r"\d+(\.\d+)?\s*[-+*/^×÷]\s*\(?\d"), 1.5),
+    ("solve_verb", re.compile(
+        r"\b(solve|simplify|evaluate|calculate|compute|factori[sz]e|factor|differentiate|integrate|expand"
+        r"|prove that|find the (value|area|perimeter|volume|derivative|roots?)|find [a-z]\b)"), 2.0),
+    ("homework_phrase", re.compile(
+        r"\b(homework|assignment|worksheet|(exercise|question|problem|q)\s*#?\d+|due (tomorrow|today)"
+        r"|show (your|the|all) work(ing)?|step[- ]by[- ]step|answer key)\b"), 1.5),
+    ("direct_question", re.compile(r"\bwhat(\s+is|'s)\s+-?\d"), 1.0),
+    ("math_noun", re.compile(
+        r"\b(equations?|fractions?|derivatives?|integrals?|triangles?|angles?|area|perimeter|polynomials?"
+        r"|quadratic|algebra|geometry|arithmetic|primes?|percent(age)?|ratio|slope|matrix)\b"), 0.5),
+    # Non-homework signals
+    ("greeting_or_meta", re.compile(
+        r"^(hi|hello|hey|thanks|thank you|good (morning|evening))\b|\bwho (built|made|created) you\b"
+        r"|\bwhat can you do\b|\byour name\b"), -3.0),
+    ("quiz_request", re.compile(
+        r"\bquiz(zes)?\b|\bmultiple[- ]choice\b|\b(generate|create|make|give me)\b.*\bquestions\b"), -2.5),
+    ("conceptual", re.compile(r"^(can you )?(explain|why|how does|what does)\b(?!.*\d)"), -1.0),
+]
+_DIGIT = re.compile(r"\d")
+
+# -----------------------------
+# 3️⃣ Scoring & decision
+# -----------------------------
+@dataclass
+class PrecheckResult:
+    is_math_homework: bool
+    probability: float
+    reasoning: str
+
+@dataclass
+class PrecheckStats:
+    homework: int = 0
+    clean: int = 0
+    escalated: int = 0
+
+    @property
+    def escalation_rate(self) -> float:
+        total = self.homework + self.clean + self.escalated
+        return self.escalated / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "homework": self.homework,
+            "clean": self.clean,
+            "escalated": self.escalated,
+            "escalation_rate": self.escalation_rate,
+        }
+
+stats = PrecheckStats()
+
+def score(text: str) -> tuple[float, list[str]]:
+    text = text.lower().strip()
+    total = BIAS
+    matched = []
+    for name, pattern, weight in FEATURES:
+        if pattern.search(text):
+            total += weight
+            matched.append(name)
+    # Messages with no numbers and no math vocabulary are rarely homework
+    if not _DIGIT.search(text) and "math_noun" not in matched:
+        total -= 1.5
+        matched.append("no_math")
+    return 1.0 / (1.0 + math.exp(-total)), matched
+
+def precheck(input: str | list[TResponseInputItem]) -> PrecheckResult | None:
+    # Returns a confident local verdict, or None to escalate to the LLM
+    if not PRECHECK_ENABLED:
+        return None
+    probability, matched = score(input_text(input))
+    reasoning = f"Local pre-check (p={probability:.2f}; {', '.join(matched) or 'no features'})"
+    if probability >= HOMEWORK_THRESHOLD:
+        stats.homework += 1
+        return PrecheckResult(True, probability, reasoning)
+    if probability <= CLEAN_THRESHOLD:
+        stats.clean += 1
+        return PrecheckResult(False, probability, reasoning)
+    stats.escalated += 1
+    return None
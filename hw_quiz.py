@@ -180,15 +180,15 @@
 
 
 import os
+import re
+import logging
+from dataclasses import dataclass
+from typing import Any
 import chainlit as cl
 from pydantic import BaseModel
-from dotenv import load_dotenv, find_dotenv
 from openai.types.responses import ResponseTextDeltaEvent
 from agents import (
     Agent,
-    RunConfig,
-    AsyncOpenAI,
-    OpenAIChatCompletionsModel,
     Runner,
     GuardrailFunctionOutput,
     InputGuardrailTripwireTriggered,
@@ -198,40 +198,42 @@ from agents import (
     input_guardrail,
     output_guardrail,
 )
+import gemini_provider
+from call_budget import background_task, call_budget
+from scheduler import on_busy
+import metrics
+from metrics import MeteredFlush, timed
+from token_usage import BUDGET_MESSAGE, EXHAUSTED, NORMAL, budget_level, for_budget, ledger, track_session, usage_hooks
+from homework_precheck import precheck
+from verdict_cache import run_cached
+from guardrail_batch import MicroBatcher
+from stream_guardrail import StreamingOutputGuard, MAX_CHECKS
+from gemini_provider import model, guardrail_model, run_config
+from history_manager import ConversationHistory
+from json_stream import JsonFieldStream
+from guardrail_audit import REDACTED_MESSAGE, auditor
+from semantic_cache import semantic_cache
+
+# "final": check the whole answer after generation (default)
+# "stream": check windows while tokens arrive and cancel on a violation
+# "audit": deliver first, check a per-tenant sample in the background and
+#          redact the message afterwards on a violation (flagged sessions
+#          go back to "final")
+OUTPUT_GUARDRAIL_MODE = os.getenv("OUTPUT_GUARDRAIL_MODE", "final")
+
+# "separate": guardrail agents + quiz agent, up to three calls (default)
+# "combined": one call returns the answer with both verdicts, checked locally
+# "compare": serve "combined", re-check with the guardrail agents in the
+#            background and record how often the verdicts agree
+GUARDRAIL_MODE = os.getenv("GUARDRAIL_MODE", "separate")
+
+logger = logging.getLogger(__name__)
+
+# Answers that passed the output guardrail, served again to near-duplicates
+answer_cache = semantic_cache("hw_quiz")
 
 # -----------------------------
-# 1️⃣ Load API key
-# -----------------------------
-load_dotenv(find_dotenv())
-gemini_api_key = os.getenv("GOOGLE_API_KEY")
-
-# -----------------------------
-# 2️⃣ Provider – connection to Gemini API
-# -----------------------------
-provider = AsyncOpenAI(
-    api_key=gemini_api_key,
-    base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
-)
-
-# -----------------------------
-# 3️⃣ Model – Gemini Chat Completion
-# -----------------------------
-model = OpenAIChatCompletionsModel(
-    model="gemini-2.5-flash",
-    openai_client=provider,
-)
-
-# -----------------------------
-# 4️⃣ RunConfig – run settings
-# -----------------------------
-run_config = RunConfig(
-    model=model,
-    model_provider=provider,
-    tracing_disabled=True
-)
-
-# -----------------------------
-# 5️⃣ Input Guardrail – Math Homework Detection
+# 1️⃣ Input Guardrail – Math Homework Detection
 # -----------------------------
 class MathHomeworkOutput(BaseModel):
     is_math_homework: bool
@@ -241,24 +243,37 @@ guardrail_input_agent = Agent(
     name="Input Guardrail Agent",
     instructions="Check if the user is asking you to do their math homework. Return is_math_homework True/False.",
     output_type=MathHomeworkOutput,
-    model=model,
+    model=guardrail_model,
+    hooks=usage_hooks,
 )
 
+# Concurrent chats share classification calls (GUARDRAIL_BATCH_ENABLED)
+input_batcher = MicroBatcher(guardrail_input_agent)
+
+async def classify_homework(input: str | list[TResponseInputItem], context: Any = None) -> MathHomeworkOutput:
+    # Obvious inputs are decided by the local pre-check; only ambiguous ones
+    # reach the helper agent (cached verdicts for repeated inputs skip it too).
+    # Also run before serving a cached answer, which skips the agent's guardrail
+    local = precheck(input)
+    if local is not None:
+        return MathHomeworkOutput(is_math_homework=local.is_math_homework, reasoning=local.reasoning)
+    return await run_cached(guardrail_input_agent, input, context, classify=input_batcher.classify)
+
 @input_guardrail
+@timed("guardrail_seconds", guardrail="math_input", app="hw_quiz")
 async def math_input_guardrail(
     ctx: RunContextWrapper[None],
     agent: Agent,
     input: str | list[TResponseInputItem]
 ) -> GuardrailFunctionOutput:
-    # Run helper agent to detect math homework
-    result = await Runner.run(guardrail_input_agent, input, context=ctx.context)
+    verdict = await classify_homework(input, ctx.context)
     return GuardrailFunctionOutput(
-        output_info=result.final_output,
-        tripwire_triggered=result.final_output.is_math_homework,
+        output_info=verdict,
+        tripwire_triggered=verdict.is_math_homework,
     )
 
 # -----------------------------
-# 6️⃣ Output Guardrail – Math Content Detection
+# 2️⃣ Output Guardrail – Math Content Detection
 # -----------------------------
 class MessageOutput(BaseModel):
     response: str
@@ -271,10 +286,12 @@ guardrail_output_agent = Agent(
     name="Output Guardrail Agent",
     instructions="Check if the output includes any math content. Return is_math True/False.",
     output_type=MathOutput,
-    model=model,
+    model=guardrail_model,
+    hooks=usage_hooks,
 )
 
 @output_guardrail
+@timed("guardrail_seconds", guardrail="math_output", app="hw_quiz")
 async def math_output_guardrail(
     ctx: RunContextWrapper,
     agent: Agent,
@@ -286,8 +303,27 @@ async def math_output_guardrail(
         tripwire_triggered=result.final_output.is_math,
     )
 
+@timed("guardrail_seconds", guardrail="math_window", app="hw_quiz")
+async def math_window_check(text: str) -> bool:
+    # Same check as math_output_guardrail, applied to one window of the stream
+    result = await Runner.run(guardrail_output_agent, text)
+    return result.final_output.is_math
+
+@timed("guardrail_seconds", guardrail="math_audit", app="hw_quiz")
+async def math_audit_check(text: str) -> tuple[bool, str]:
+    # Post-hoc variant for OUTPUT_GUARDRAIL_MODE=audit: runs off the handler's
+    # call budget after the answer was delivered, keeps the reasoning for the log
+    result = await Runner.run(guardrail_output_agent, text)
+    return result.final_output.is_math, result.final_output.reasoning
+
+def current_tenant() -> str:
+    # Tenants come from the authenticated user's metadata; anonymous chats
+    # share the default sampling rate
+    user = cl.user_session.get("user")
+    return (getattr(user, "metadata", None) or {}).get("tenant", "default")
+
 # -----------------------------
-# 7️⃣ Agent – Math Quiz & Homework Generator
+# 3️⃣ Agent – Math Quiz & Homework Generator
 # -----------------------------
 agent_quiz: Agent = Agent(
     name="Math Quiz & Homework Generator",
@@ -300,52 +336,295 @@ agent_quiz: Agent = Agent(
     model=model,
     input_guardrails=[math_input_guardrail],
     output_guardrails=[math_output_guardrail],
-    output_type=MessageOutput
+    output_type=MessageOutput,
+    hooks=usage_hooks,
 )
 
+# In "stream" mode the output guardrail runs on stream windows instead, in
+# "audit" mode after delivery
+agent_quiz_streamed: Agent = agent_quiz.clone(output_guardrails=[])
+
 # -----------------------------
-# 8️⃣ Greeting
+# 4️⃣ Combined mode – answer and verdicts from one call
+# -----------------------------
+class CombinedOutput(BaseModel):
+    # Verdicts come first so they are streamed before the answer text
+    is_math_homework: bool
+    is_math: bool
+    response: str
+
+@dataclass
+class CombinedContext:
+    check_homework: bool   # False when the local pre-check already cleared the input
+
+@output_guardrail
+@timed("guardrail_seconds", guardrail="combined", app="hw_quiz")
+async def combined_output_guardrail(
+    ctx: RunContextWrapper[CombinedContext],
+    agent: Agent,
+    output: CombinedOutput
+) -> GuardrailFunctionOutput:
+    # No model call: the verdicts are fields of the answer itself
+    homework = output.is_math_homework and ctx.context.check_homework
+    return GuardrailFunctionOutput(
+        output_info={"is_math_homework": homework, "is_math": output.is_math},
+        tripwire_triggered=homework or output.is_math,
+    )
+
+agent_quiz_combined: Agent = agent_quiz.clone(
+    instructions=(
+        "You are a math assistant. You can generate math quizzes or help with math homework. "
+        "If the user asks for a quiz, create 3 multiple-choice math questions with 4 options each and mark the correct answer. "
+        "If the user asks for homework help, solve the problem step by step clearly. "
+        "Also classify the exchange: is_math_homework is true if the user is asking you to do their math homework; "
+        "is_math is true if your response includes any math content. "
+        "Always return JSON with the verdicts first: "
+        "{\"is_math_homework\": true/false, \"is_math\": true/false, \"response\": \"your answer here\"}"
+    ),
+    input_guardrails=[],
+    output_guardrails=[combined_output_guardrail],
+    output_type=CombinedOutput,
+)
+
+_VERDICT_FIELD = re.compile(r'"(is_math_homework|is_math)"\s*:\s*(true|false)')
+
+def streamed_verdicts(raw: str) -> dict[str, bool]:
+    # Verdicts already complete in the raw JSON streamed so far
+    return {name: value == "true" for name, value in _VERDICT_FIELD.findall(raw)}
+
+class VerdictAgreement:
+    # How often the combined call's verdicts match the separate guardrail agents
+    def __init__(self):
+        self.counts: dict[str, dict[str, int]] = {}
+
+    def record(self, verdict: str, combined: bool, separate: bool) -> None:
+        outcome = "agree" if combined == separate else f"combined_{str(combined).lower()}_separate_{str(separate).lower()}"
+        counts = self.counts.setdefault(verdict, {})
+        counts[outcome] = counts.get(outcome, 0) + 1
+        metrics.metrics.inc("guardrail_agreement_total", verdict=verdict, outcome=outcome)
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        return {
+            verdict: {**counts, "agreement": round(counts.get("agree", 0) / sum(counts.values()), 3)}
+            for verdict, counts in self.counts.items()
+        }
+
+agreement = VerdictAgreement()
+
+async def compare_verdicts(prompt, verdicts: dict[str, bool], response: str | None) -> None:
+    # Runs off the handler's call budget; the user already has their answer
+    try:
+        if "is_math_homework" in verdicts:
+            separate = await run_cached(guardrail_input_agent, prompt)
+            agreement.record("homework", verdicts["is_math_homework"], separate.is_math_homework)
+        if "is_math" in verdicts and response:
+            result = await Runner.run(guardrail_output_agent, response)
+            agreement.record("math", verdicts["is_math"], result.final_output.is_math)
+    except Exception as e:
+        logger.warning("Verdict comparison failed: %s", e)
+
+async def answer_combined(question: str | None, history: ConversationHistory, msg: cl.Message, flush: MeteredFlush) -> None:
+    # `question` is the message to cache the answer under, None when the
+    # answer depends on earlier turns
+    prompt = history.prompt()
+    # A confident local pre-check decides the homework verdict without the model
+    local = precheck(prompt)
+    if local is not None and local.is_math_homework:
+        await msg.remove()
+        await cl.Message(content=f"⚠️ Input guardrail triggered: {local.reasoning}").send()
+        return
+
+    response_text = JsonFieldStream("response")
+    raw, verdicts = "", {}
+    tripped = None
+    result = Runner.run_streamed(
+        for_budget(agent_quiz_combined),
+        input=prompt,
+        run_config=run_config,
+        context=CombinedContext(check_homework=local is None),
+    )
+    try:
+        async for event in result.stream_events():
+            if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                if len(verdicts) < 2 and not response_text.matches:
+                    # Check the verdicts before any answer text reaches the UI
+                    raw += event.data.delta
+                    verdicts = streamed_verdicts(raw)
+                    if (verdicts.get("is_math_homework") and local is None) or verdicts.get("is_math"):
+                        result.cancel()
+                        tripped = verdicts
+                        break
+                text = response_text.feed(event.data.delta)
+                if text:
+                    await flush(text)
+    except OutputGuardrailTripwireTriggered as e:
+        # Verdicts streamed after the answer: caught by the local guardrail
+        tripped = e.guardrail_result.output.output_info
+
+    if tripped is not None:
+        await msg.remove()
+        if tripped.get("is_math_homework") and local is None:
+            await cl.Message(content="⚠️ Input guardrail triggered: Math homework detected!").send()
+        else:
+            await cl.Message(content="⚠️ Output guardrail triggered: Math content detected!").send()
+        if GUARDRAIL_MODE == "compare" and local is None:
+            background_task(compare_verdicts(prompt, {k: v for k, v in tripped.items() if k == "is_math_homework"}, None))
+        return
+
+    output = result.final_output
+    if not response_text.text:
+        await flush(output.response)
+    history.append({"role": "assistant", "content": output.response})
+    if question is not None and budget_level() == NORMAL:
+        answer_cache.put(question, output.response)
+    if GUARDRAIL_MODE == "compare":
+        # A pre-checked input gets the same homework verdict in both modes
+        checked = {"is_math": output.is_math} if local is not None else {"is_math_homework": output.is_math_homework, "is_math": output.is_math}
+        background_task(compare_verdicts(prompt, checked, output.response))
+
+# -----------------------------
+# 5️⃣ Startup – warm Gemini connections before the first message
+# -----------------------------
+@cl.on_app_startup
+async def handle_app_startup():
+    await gemini_provider.warm_up()
+    await metrics.start()
+    await auditor.load()
+
+@cl.on_app_shutdown
+async def handle_app_shutdown():
+    answer_cache.save()
+    await auditor.drain()
+    await metrics.stop()
+    await gemini_provider.close()
+
+# -----------------------------
+# 6️⃣ Greeting
 # -----------------------------
 @cl.on_chat_start
 async def handle_chat_start():
     if cl.user_session.get("greeted"):
         return
     cl.user_session.set("greeted", True)
-    cl.user_session.set("history", [])
+    cl.user_session.set("history", ConversationHistory(cl.user_session.get("id")))
     await cl.Message(
         content="📐 **Welcome!** I am a Math Quiz & Homework Assistant 🤖 built by **Haseeb Ur Rehman**.\n\n"
                 "You can ask me to generate math quizzes or solve math homework problems!"
     ).send()
 
 # -----------------------------
-# 9️⃣ Handling user messages
+# 7️⃣ Chat end – free the session's history and token tally from RAM
+# -----------------------------
+@cl.on_chat_end
+async def handle_chat_end():
+    history = cl.user_session.get("history")
+    if history is not None:
+        history.release()
+    ledger.release(cl.user_session.get("id"))
+
+# -----------------------------
+# 8️⃣ Handling user messages
 # -----------------------------
 @cl.on_message
+@timed("handler_seconds", app="hw_quiz")
+@on_busy(lambda text: cl.Message(content=text).send())
+# one combined call, or input guardrail + quiz agent + output guardrail
+# (one check per stream window; audits run off-budget, but flagged sessions
+# are checked inline)
+@call_budget(1 if GUARDRAIL_MODE != "separate" else 2 + MAX_CHECKS if OUTPUT_GUARDRAIL_MODE == "stream" else 3)
+@track_session(lambda: cl.user_session.get("id"))
 async def handle_message(message: cl.Message):
     history = cl.user_session.get("history")
     msg = cl.Message(content="")
+    flush = MeteredFlush(msg.stream_token, app="hw_quiz")
     await msg.send()
 
-    # Save user input to history
+    # The semantic cache only knows single messages: a follow-up such as
+    # "and the next one?" means something else in every chat
+    cache_key = message.content if len(history) == 0 else None
+
+    # Save user input to history; the prompt is a summary of older turns
+    # plus the recent ones that fit the token budget
     history.append({"role": "user", "content": message.content})
 
+    # No quiz bank here: bank quizzes are math content, which this app's
+    # output guardrail blocks. Near-duplicates of answers that passed the
+    # guardrails are served again
+    cached = answer_cache.get(cache_key) if cache_key is not None else None
+    # The cache key drops wording, not intent: a hit is served only to a
+    # message the input guardrail passes
+    if cached is not None and not (await classify_homework(cache_key)).is_math_homework:
+        await flush(cached)
+        history.append({"role": "assistant", "content": cached})
+        return
+
+    # Past the chat's token budget only cached answers are served; close to it
+    # the agent is asked for shorter answers
+    if budget_level() == EXHAUSTED:
+        await flush(BUDGET_MESSAGE)
+        return
+
+    if GUARDRAIL_MODE != "separate":
+        await answer_combined(cache_key, history, msg, flush)
+        return
+
+    # The answer streams as {"response": "..."}; only the field's text is shown
+    response_text = JsonFieldStream("response")
+
     try:
-        # Run the math quiz/homework agent
-        result = Runner.run_streamed(
-            agent_quiz,
-            input=history,
-            run_config=run_config,
-        )
-
-        # Stream the assistant response token by token
-        async for event in result.stream_events():
-            if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
-                await msg.stream_token(event.data.delta)
+        if OUTPUT_GUARDRAIL_MODE == "stream":
+            # Windows are checked while generating; a flagged window cancels
+            # the run before the rest is generated or shown
+            result = Runner.run_streamed(
+                for_budget(agent_quiz_streamed),
+                input=history.prompt(),
+                run_config=run_config,
+            )
+            guard = StreamingOutputGuard(math_window_check)
+            if not await guard.pump(result, flush, transform=response_text.feed):
+                await msg.remove()
+                await cl.Message(content="⚠️ Output guardrail triggered: Math content detected!").send()
+                return
+        else:
+            # Run the math quiz/homework agent; audited answers skip the
+            # inline output guardrail
+            session_id = cl.user_session.get("id")
+            audited = OUTPUT_GUARDRAIL_MODE == "audit" and not auditor.is_flagged(session_id)
+            result = Runner.run_streamed(
+                for_budget(agent_quiz_streamed if audited else agent_quiz),
+                input=history.prompt(),
+                run_config=run_config,
+            )
+
+            # Stream the text of the `response` field token by token
+            async for event in result.stream_events():
+                if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                    text = response_text.feed(event.data.delta)
+                    if text:
+                        await flush(text)
+
+        # Nothing extracted (the model skipped the JSON wrapper): show the parsed answer
+        if not response_text.text:
+            await flush(result.final_output.response)
 
         # Save assistant output to history
-        history.append({"role": "assistant", "content": result.final_output.response})
+        answer_index = history.append({"role": "assistant", "content": result.final_output.response})
         cl.user_session.set("history", history)
 
+        if OUTPUT_GUARDRAIL_MODE == "audit" and audited:
+            async def redact():
+                msg.content = REDACTED_MESSAGE
+                await msg.update()
+                # Later turns must not send the flagged answer back to the model
+                history.replace(answer_index, {"role": "assistant", "content": REDACTED_MESSAGE})
+
+            auditor.submit("math_output", math_audit_check, result.final_output.response, redact,
+                           session_id=session_id, tenant=current_tenant(), message_id=msg.id)
+        elif cache_key is not None and budget_level() == NORMAL:
+            # Answers awaiting an audit are not cached: a later redaction could not
+            # reach the copies served from the cache
+            answer_cache.put(message.content, result.final_output.response)
+
     except InputGuardrailTripwireTriggered as e:
         await cl.Message(content=f"⚠️ Input guardrail triggered: {str(e)}").send()
 
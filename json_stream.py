@@ -0,0 +1,154 @@
+# json_stream.py
+# Incremental JSON extraction for streamed structured outputs. The model
+# streams raw JSON ({"response": "Step 1:\n..."}); JsonFieldStream follows
+# the structure chunk by chunk and returns only the unescaped text of the
+# selected string field(s), so the UI shows clean text while the run keeps
+# its Pydantic output_type.
+import re
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_DELIMITERS = set(",]} \t\r\n")
+_HEX_DIGITS = set("0123456789abcdefABCDEF")
+
+class JsonFieldStream:
+    # `path` selects string values: "response", or "questions.*.question"
+    # for every question in a list model ("*" matches any key or index).
+    # Several matching values are joined with `separator`.
+    def __init__(self, path: str = "response", separator: str = "\n\n"):
+        self.pattern = path.split(".")
+        self.separator = separator
+        self.text = ""                 # everything extracted so far
+        self.matches = 0
+        self._stack: list[list] = []   # [key | None, expecting_key] for objects, [index] for arrays
+        self._started = False
+        self._in_string = False
+        self._in_literal = False
+        self._string_is_key = False
+        self._emit = False
+        self._key = ""
+        self._escape = False
+        self._unicode = ""             # pending \uXXXX hex digits
+        self._high_surrogate = ""
+
+    # -----------------------------
+    # 1️⃣ Paths
+    # -----------------------------
+    def _path(self) -> list[str]:
+        return [str(frame[0]) for frame in self._stack]
+
+    def _matches(self) -> bool:
+        path = self._path()
+        return len(path) == len(self.pattern) and all(p in ("*", q) for p, q in zip(self.pattern, path))
+
+    # -----------------------------
+    # 2️⃣ Feeding
+    # -----------------------------
+    def feed(self, chunk: str) -> str:
+        # Returns the newly extracted text (possibly "")
+        out: list[str] = []
+        i, n = 0, len(chunk)
+        while i < n:
+            if self._in_string:
+                i = self._string(chunk, i, out)
+                continue
+            ch = chunk[i]
+            i += 1
+            if self._in_literal:
+                if ch not in _DELIMITERS:
+                    continue   # numbers, true / false / null are skipped
+                self._in_literal = False
+            if not self._started:
+                # Skip anything before the document, e.g. a ```json fence
+                if ch not in "{[":
+                    continue
+                self._started = True
+            if ch in " \t\r\n":
+                continue
+            top = self._stack[-1] if self._stack else None
+            if ch == "{":
+                self._stack.append([None, True])
+            elif ch == "[":
+                self._stack.append([0])
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+            elif ch == ":":
+                if top is not None and len(top) == 2:
+                    top[1] = False
+            elif ch == ",":
+                if top is not None:
+                    if len(top) == 2:
+                        top[1] = True
+                    else:
+                        top[0] += 1
+            elif ch == '"':
+                self._in_string = True
+                self._string_is_key = top is not None and len(top) == 2 and top[1]
+                self._key = ""
+                self._emit = not self._string_is_key and self._matches()
+                if self._emit:
+                    if self.matches and self.separator:
+                        out.append(self.separator)
+                    self.matches += 1
+            else:
+                self._in_literal = True
+        extracted = "".join(out)
+        self.text += extracted
+        return extracted
+
+    def _string(self, chunk: str, i: int, out: list[str]) -> int:
+        # Consumes string content from chunk[i:]; returns the next index
+        if self._escape or self._unicode:
+            return self._escape_char(chunk, i, out)
+        match = _STRING_SPECIAL.search(chunk, i)
+        end = match.start() if match else len(chunk)
+        if end > i:
+            self._take(chunk[i:end], out)
+        if match is None:
+            return end
+        if chunk[end] == "\\":
+            self._escape = True
+            return end + 1
+        # Closing quote
+        self._in_string = False
+        if self._string_is_key:
+            self._stack[-1][0] = self._key
+        return end + 1
+
+    def _escape_char(self, chunk: str, i: int, out: list[str]) -> int:
+        if self._escape:
+            self._escape = False
+            ch = chunk[i]
+            if ch == "u":
+                self._unicode = "u"
+                return i + 1
+            self._take(_ESCAPES.get(ch, ch), out)
+            return i + 1
+        # Collect the 4 hex digits of \uXXXX, possibly across chunks
+        while len(self._unicode) < 5 and i < len(chunk):
+            if chunk[i] not in _HEX_DIGITS:
+                # Malformed escape: emit it as written and read on from here
+                self._take("\\" + self._unicode, out)
+                self._unicode = ""
+                return i
+            self._unicode += chunk[i]
+            i += 1
+        if len(self._unicode) == 5:
+            code = int(self._unicode[1:], 16)
+            self._unicode = ""
+            if 0xD800 <= code < 0xDC00:
+                self._high_surrogate = chr(code)
+            elif 0xDC00 <= code < 0xE000 and self._high_surrogate:
+                pair = (self._high_surrogate + chr(code)).encode("utf-16", "surrogatepass").decode("utf-16")
+                self._high_surrogate = ""
+                self._take(pair, out)
+            else:
+                self._take(chr(code), out)
+        return i
+
+    def _take(self, text: str, out: list[str]) -> None:
+        if self._string_is_key:
+            self._key += text
+        elif self._emit:
+            out.append(text)
@@ -1,12 +1,8 @@
-import os
+from typing import Any
 import chainlit as cl
 from pydantic import BaseModel
-from dotenv import load_dotenv, find_dotenv
 from agents import (
     Agent,
-    RunConfig,
-    AsyncOpenAI,
-    OpenAIChatCompletionsModel,
     Runner,
     GuardrailFunctionOutput,
     InputGuardrailTripwireTriggered,
@@ -14,40 +10,23 @@ from agents import (
     TResponseInputItem,
     input_guardrail,
 )
+import gemini_provider
+from call_budget import call_budget
+from scheduler import on_busy
+import metrics
+from metrics import timed
+from token_usage import BUDGET_MESSAGE, EXHAUSTED, NORMAL, budget_level, for_budget, ledger, track_session, usage_hooks
+from homework_precheck import precheck
+from verdict_cache import run_cached
+from guardrail_batch import MicroBatcher
+from semantic_cache import semantic_cache
+from gemini_provider import model, guardrail_model
 
-# -----------------------------
-# 1️⃣ Load API key
-# -----------------------------
-load_dotenv(find_dotenv())
-gemini_api_key = os.getenv("GOOGLE_API_KEY")
-
-# -----------------------------
-# 2️⃣ Provider – connection to Gemini API
-# -----------------------------
-provider = AsyncOpenAI(
-    api_key=gemini_api_key,
-    base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
-)
-
-# -----------------------------
-# 3️⃣ Model – Gemini Chat Completion
-# -----------------------------
-model = OpenAIChatCompletionsModel(
-    model="gemini-2.5-flash",
-    openai_client=provider,
-)
-
-# -----------------------------
-# 4️⃣ RunConfig – run settings
-# -----------------------------
-run_config = RunConfig(
-    model=model,
-    model_provider=provider,
-    tracing_disabled=True
-)
+# Answers to messages that passed the guardrails, served again to near-duplicates
+answer_cache = semantic_cache("math_hw_detection")
 
 # -----------------------------
-# 5️⃣ Input Guardrail – Math Homework Detection
+# 1️⃣ Input Guardrail – Math Homework Detection
 # -----------------------------
 class MathHomeworkOutput(BaseModel):
     is_math_homework: bool
@@ -57,65 +36,116 @@ guardrail_input_agent = Agent(
     name="Math Homework Guardrail Agent",
     instructions="Check if the user is asking for math homework help. Return is_math_homework True/False.",
     output_type=MathHomeworkOutput,
-    model=model,
+    model=guardrail_model,
+    hooks=usage_hooks,
 )
 
+# Concurrent chats share classification calls (GUARDRAIL_BATCH_ENABLED)
+input_batcher = MicroBatcher(guardrail_input_agent)
+
+async def classify_homework(input: str | list[TResponseInputItem], context: Any = None) -> MathHomeworkOutput:
+    # Obvious inputs are decided by the local pre-check; only ambiguous ones
+    # reach the helper agent (cached verdicts for repeated inputs skip it too).
+    # Also run before serving a cached answer, which skips the agent's guardrail
+    local = precheck(input)
+    if local is not None:
+        return MathHomeworkOutput(is_math_homework=local.is_math_homework, reasoning=local.reasoning)
+    return await run_cached(guardrail_input_agent, input, context, classify=input_batcher.classify)
+
 @input_guardrail
+@timed("guardrail_seconds", guardrail="math_input", app="math_hw_detection")
 async def math_input_guardrail( ctx: RunContextWrapper[None], agent: Agent,input: str | list[TResponseInputItem]) -> GuardrailFunctionOutput:
-    result = await Runner.run(guardrail_input_agent, input, context=ctx.context)
+    verdict = await classify_homework(input, ctx.context)
     return GuardrailFunctionOutput(
-        output_info=result.final_output,
-        tripwire_triggered=result.final_output.is_math_homework,
+        output_info=verdict,
+        tripwire_triggered=verdict.is_math_homework,
     )
 
 # -----------------------------
-# 6️⃣ Main Agent – Only Homework Detection
+# 2️⃣ Main Agent – Only Homework Detection
 # -----------------------------
 agent_homework: Agent = Agent(
     name="Math Homework Detector",
     instructions="You are an assistant that only detects if the user is asking for math homework help.",
     model=model,
     input_guardrails=[math_input_guardrail],
+    hooks=usage_hooks,
 )
 
 # -----------------------------
-# 7️⃣ Greeting
+# 3️⃣ Startup – warm Gemini connections before the first message
+# -----------------------------
+@cl.on_app_startup
+async def handle_app_startup():
+    await gemini_provider.warm_up()
+    await metrics.start()
+
+@cl.on_app_shutdown
+async def handle_app_shutdown():
+    answer_cache.save()
+    await metrics.stop()
+    await gemini_provider.close()
+
+# -----------------------------
+# 4️⃣ Greeting
 # -----------------------------
 @cl.on_chat_start
 async def handle_chat_start():
     if cl.user_session.get("greeted"):
         return
     cl.user_session.set("greeted", True)
-    cl.user_session.set("history", [])
     await cl.Message(
         content="📐 **Welcome!** I am a Math Homework Detector 🤖 built by **Haseeb Ur Rehman**.\n\n"
                 "Send me a message, and I will detect if it is a math homework question."
     ).send()
 
 # -----------------------------
-# 8️⃣ Handling user messages
+# 5️⃣ Chat end – free the session's token tally
+# -----------------------------
+@cl.on_chat_end
+async def handle_chat_end():
+    ledger.release(cl.user_session.get("id"))
+
+# -----------------------------
+# 6️⃣ Handling user messages
 # -----------------------------
 @cl.on_message
+@timed("handler_seconds", app="math_hw_detection")
+@on_busy(lambda text: cl.Message(content=text).send())
+@call_budget(2)  # input guardrail + homework agent
+@track_session(lambda: cl.user_session.get("id"))
 async def handle_message(message: cl.Message):
-    history = cl.user_session.get("history")
     msg = cl.Message(content="")
     await msg.send()
 
-    # Save user input to history
-    history.append({"role": "user", "content": message.content})
+    # Near-duplicates of answered messages are served without a model call.
+    # Only a chat's opening message is looked up or stored: later ones may
+    # lean on what was said before ("and the next one?"), which the cache
+    # cannot tell apart between chats
+    opening = not cl.user_session.get("messages_seen")
+    cl.user_session.set("messages_seen", True)
+    cached = answer_cache.get(message.content) if opening else None
+    # The cache key drops wording, not intent: a hit is served only to a
+    # message the input guardrail passes
+    if cached is not None and not (await classify_homework(message.content)).is_math_homework:
+        await cl.Message(content="✅ This is not detected as math homework.").send()
+        await cl.Message(content=cached).send()
+        return
+
+    # Past the chat's token budget nothing more is generated; close to it
+    # the agent is asked for shorter answers
+    if budget_level() == EXHAUSTED:
+        await cl.Message(content=BUDGET_MESSAGE).send()
+        return
 
     try:
-         # Run agent to check homework
-        await Runner.run(agent_homework, message.content)
-        # If no guardrail triggered, give a normal answer
-        result = await Runner.run(agent_homework, message.content)
+        # One guarded run: the input guardrail classifies while the agent answers
+        result = await Runner.run(for_budget(agent_homework), message.content)
         await cl.Message(content="✅ This is not detected as math homework.").send()
         await cl.Message(content=result.final_output).send()
+        # Only full-length answers are cached
+        if opening and budget_level() == NORMAL:
+            answer_cache.put(message.content, result.final_output)
 
     except InputGuardrailTripwireTriggered:
         await cl.Message(content="⚠️ Input guardrail triggered: Math homework detected!").send()
-
-    # Update history
-    cl.user_session.set("history", history)
-
-        # await cl.Message(content="✅ This is not detected as math homework.").send()
@@ -0,0 +1,296 @@
+# metrics.py
+# Local hot-path instrumentation. Spans (handler latency, guardrail runs,
+# model calls, UI flushes) and rates (TTFT, tokens/sec) are aggregated in
+# memory into fixed-bucket histograms and counters, then exported as
+# Prometheus text on METRICS_PORT and/or appended as JSONL snapshots to
+# METRICS_JSONL. Nothing leaves the process unless one of those is set.
+import os
+import json
+import time
+import asyncio
+import logging
+import functools
+from bisect import bisect_left
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+from agents import Model
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# 1️⃣ Settings
+# -----------------------------
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))              # 0 = no Prometheus endpoint
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_JSONL = os.getenv("METRICS_JSONL", "")                  # "" = no JSONL dumps
+METRICS_DUMP_INTERVAL = float(os.getenv("METRICS_DUMP_INTERVAL", "60"))
+METRICS_PREFIX = "assistant_"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RATE_BUCKETS = (5, 10, 20, 40, 60, 80, 100, 150, 200, 300, 500)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+# Histograms not listed here measure seconds
+BUCKETS = {"model_tokens_per_second": RATE_BUCKETS, "guardrail_batch_size": SIZE_BUCKETS}
+
+# -----------------------------
+# 2️⃣ Histograms & registry
+# -----------------------------
+Labels = tuple[tuple[str, str], ...]
+
+@dataclass
+class Histogram:
+    bounds: tuple[float, ...]
+    counts: list[int] = field(default_factory=list)   # per bucket, last one is +Inf
+    total: float = 0.0
+    count: int = 0
+
+    def __post_init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float | None:
+        # Linear interpolation inside the bucket holding the q-th observation
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                if i == len(self.bounds):
+                    return self.bounds[-1]
+                low = self.bounds[i - 1] if i else 0.0
+                return low + (self.bounds[i] - low) * (rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+class Registry:
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self.histograms: dict[tuple[str, Labels], Histogram] = {}
+        self.counters: dict[tuple[str, Labels], float] = {}
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(BUCKETS.get(name, LATENCY_BUCKETS))
+        histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    @contextmanager
+    def span(self, name: str, **labels: str):
+        # `with metrics.span("x_seconds", app="..."):` – also around awaits
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self) -> None:
+        self.histograms.clear()
+        self.counters.clear()
+
+    # -----------------------------
+    # 3️⃣ Export formats
+    # -----------------------------
+    def prometheus_text(self) -> str:
+        def fmt(labels: Labels, extra: str = "") -> str:
+            parts = [f'{k}="{v}"' for k, v in labels] + ([extra] if extra else [])
+            return "{" + ",".join(parts) + "}" if parts else ""
+
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            metric = METRICS_PREFIX + name
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{fmt(labels)} {value:g}")
+        for (name, labels), h in sorted(self.histograms.items(), key=lambda item: item[0]):
+            metric = METRICS_PREFIX + name
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip((*h.bounds, "+Inf"), h.counts):
+                cumulative += n
+                le = f'le="{bound}"'
+                lines.append(f"{metric}_bucket{fmt(labels, le)} {cumulative}")
+            lines.append(f"{metric}_sum{fmt(labels)} {h.total:g}")
+            lines.append(f"{metric}_count{fmt(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        now = time.time()
+        rows = [
+            {"ts": now, "metric": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in self.counters.items()
+        ]
+        for (name, labels), h in self.histograms.items():
+            rows.append({
+                "ts": now,
+                "metric": name,
+                "labels": dict(labels),
+                "count": h.count,
+                "sum": round(h.total, 6),
+                **{f"p{int(q * 100)}": round(h.quantile(q), 6) for q in (0.5, 0.95, 0.99)},
+            })
+        return rows
+
+    def dump_jsonl(self, path: str, rows: list[dict[str, Any]] | None = None) -> None:
+        # Pass rows taken on the event loop when writing from another thread:
+        # the registry is mutated by the loop without a lock
+        with open(path, "a", encoding="utf-8") as f:
+            for row in self.snapshot() if rows is None else rows:
+                f.write(json.dumps(row) + "\n")
+
+# Shared process-wide registry
+metrics = Registry()
+
+# -----------------------------
+# 4️⃣ Instrumentation helpers
+# -----------------------------
+def timed(name: str, **labels: str):
+    # Histogram of an async function's duration, errors included:
+    #   @timed("handler_seconds", app="hw_quiz")
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with metrics.span(name, **labels):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class MeteredFlush:
+    # Wraps a UI callback such as msg.stream_token: records the time of every
+    # flush and, on the first one, the user-visible time to first token
+    # measured from when the wrapper was created (the start of the handler)
+    def __init__(self, flush: Callable[[str], Awaitable[Any]], **labels: str):
+        self.flush = flush
+        self.labels = labels
+        self.started = time.perf_counter()
+        self.first = True
+
+    async def __call__(self, text: str) -> Any:
+        start = time.perf_counter()
+        if self.first:
+            self.first = False
+            metrics.observe("ui_ttft_seconds", start - self.started, **self.labels)
+        try:
+            return await self.flush(text)
+        finally:
+            metrics.observe("ui_flush_seconds", time.perf_counter() - start, **self.labels)
+
+class MeteredModel(Model):
+    # Per logical model call: latency and outcome; for streams also the time
+    # to the first text delta and the generation rate in tokens/sec
+    def __init__(self, inner: Model, name: str):
+        self.inner = inner
+        self.name = name
+
+    async def get_response(self, *args, **kwargs):
+        outcome = "error"
+        start = time.perf_counter()
+        try:
+            response = await self.inner.get_response(*args, **kwargs)
+            outcome = "ok"
+            return response
+        finally:
+            metrics.observe("model_call_seconds", time.perf_counter() - start, model=self.name, mode="get")
+            metrics.inc("model_calls_total", model=self.name, mode="get", outcome=outcome)
+
+    async def stream_response(self, *args, **kwargs):
+        outcome = "error"
+        start = time.perf_counter()
+        first_token = None
+        chars = 0
+        output_tokens = None
+        try:
+            async for event in self.inner.stream_response(*args, **kwargs):
+                if event.type == "response.output_text.delta":
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                        metrics.observe("model_ttft_seconds", first_token - start, model=self.name)
+                    chars += len(event.delta)
+                elif event.type == "response.completed" and event.response.usage is not None:
+                    output_tokens = event.response.usage.output_tokens
+                yield event
+            outcome = "ok"
+        finally:
+            end = time.perf_counter()
+            metrics.observe("model_call_seconds", end - start, model=self.name, mode="stream")
+            metrics.inc("model_calls_total", model=self.name, mode="stream", outcome=outcome)
+            if first_token is not None and end > first_token:
+                tokens = output_tokens or chars / 4
+                metrics.observe("model_tokens_per_second", tokens / (end - first_token), model=self.name)
+
+# -----------------------------
+# 5️⃣ Exporters
+# -----------------------------
+_server: asyncio.AbstractServer | None = None
+_dumper: asyncio.Task | None = None
+
+async def _serve(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request = await asyncio.wait_for(reader.readline(), timeout=5)
+        path = request.split()[1].decode() if len(request.split()) > 1 else ""
+        if path.split("?")[0] == "/metrics":
+            status, body = "200 OK", metrics.prometheus_text().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def _dump_loop(path: str, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        rows = metrics.snapshot()   # on the loop; only the file write goes to a thread
+        try:
+            await asyncio.to_thread(metrics.dump_jsonl, path, rows)
+        except OSError as e:
+            logger.warning("Writing metrics to %s failed: %s", path, e)
+
+async def start(port: int = METRICS_PORT, jsonl_path: str = METRICS_JSONL) -> None:
+    # Idempotent; called from each app's startup hook
+    global _server, _dumper
+    if not metrics.enabled:
+        return
+    if port and _server is None:
+        try:
+            _server = await asyncio.start_server(_serve, METRICS_HOST, port)
+            logger.info("Prometheus metrics on http://%s:%d/metrics", METRICS_HOST, port)
+        except OSError as e:
+            logger.warning("Metrics endpoint not started on port %d: %s", port, e)
+    if jsonl_path and _dumper is None:
+        _dumper = asyncio.create_task(_dump_loop(jsonl_path, METRICS_DUMP_INTERVAL))
+
+async def stop(jsonl_path: str = METRICS_JSONL) -> None:
+    global _server, _dumper
+    if _dumper is not None:
+        _dumper.cancel()
+        _dumper = None
+    if _server is not None:
+        _server.close()
+        _server = None
+    if jsonl_path and metrics.enabled:
+        metrics.dump_jsonl(jsonl_path)   # final snapshot
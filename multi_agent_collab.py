@@ -1,107 +1,218 @@
 # multi_agent_collaboration_ai.py
 import os
+import asyncio
+import logging
 import chainlit as cl
 from pydantic import BaseModel
-from dotenv import load_dotenv, find_dotenv
 from agents import (
     Agent,
-    OpenAIChatCompletionsModel,
-    AsyncOpenAI,
     Runner,
-    RunConfig,
 )
+import gemini_provider
+from call_budget import call_budget
+from scheduler import on_busy
+import metrics
+from metrics import MeteredFlush, timed
+from token_usage import BUDGET_MESSAGE, EXHAUSTED, NORMAL, brief, budget_level, ledger, track_session, usage_hooks
+from gemini_provider import model
+from stage_cache import stage_cache
+from stage_pipeline import PipelineStage, run_pipeline
+
+logger = logging.getLogger(__name__)
+
+# Fan-out research: split broad queries into up to RESEARCH_FANOUT sub-topics
+# researched concurrently (0 = one monolithic research call)
+RESEARCH_FANOUT = int(os.getenv("RESEARCH_FANOUT", "0"))
+RESEARCH_CONCURRENCY = int(os.getenv("RESEARCH_CONCURRENCY", "4"))
+RESEARCH_DEADLINE = float(os.getenv("RESEARCH_DEADLINE", "20"))   # seconds per sub-topic call
 
 # -----------------------------
-# 1️⃣ Load Gemini API key
-# -----------------------------
-load_dotenv(find_dotenv())
-gemini_api_key = os.getenv("GOOGLE_API_KEY")
-
-# -----------------------------
-# 2️⃣ Provider – Gemini connection
-# -----------------------------
-provider = AsyncOpenAI(
-    api_key=gemini_api_key,
-    base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
-)
-
-# -----------------------------
-# 3️⃣ Model – Gemini Chat Completion
-# -----------------------------
-model = OpenAIChatCompletionsModel(
-    model="gemini-2.5-flash",
-    openai_client=provider,
-)
-
-# -----------------------------
-# 4️⃣ RunConfig
-# -----------------------------
-run_config = RunConfig(
-    model=model,
-    model_provider=provider,
-    tracing_disabled=True
-)
-
-# -----------------------------
-# 5️⃣ Output model for agents
+# 1️⃣ Output model for agents
 # -----------------------------
 class AgentOutput(BaseModel):
     response: str
 
+class ResearchTopics(BaseModel):
+    sub_topics: list[str]
+
+async def run_stage(agent: Agent, prompt: str) -> str:
+    # A repeated (stage, model, instructions, prompt) skips the model call
+    key = stage_cache.key(agent.name, agent, prompt)
+    cached = stage_cache.get(agent.name, key)
+    if cached is not None:
+        return cached
+    result = await Runner.run(agent, prompt)
+    output = result.final_output if isinstance(result.final_output, str) else result.final_output.response
+    stage_cache.put(key, output)
+    return output
+
 # -----------------------------
-# 6️⃣ Agents – Multi-Agent Collaboration
+# 2️⃣ Agents – Multi-Agent Collaboration
 # -----------------------------
 class ResearchAgent(Agent):
-    async def run(self, query: str, **kwargs):
+    def build_prompt(self, query: str) -> str:
         # Add role-specific instruction
-        prompt = f"You are a research assistant. Find factual information about:\n{query}"
-        result = await Runner.run(self, prompt)
-        if isinstance(result.final_output, str):
-            return result.final_output
-        return result.final_output.response
+        return f"You are a research assistant. Find factual information about:\n{query}"
+
+    async def run(self, query: str, **kwargs):
+        # Fan-out is optional: skipped once the chat nears its token budget
+        if RESEARCH_FANOUT > 0 and budget_level() == NORMAL:
+            stage = f"{self.name}:fanout"
+            key = stage_cache.key(stage, self, query)
+            cached = stage_cache.get(stage, key)
+            if cached is not None:
+                return cached
+            output = await self.fan_out(query)
+            stage_cache.put(key, output)
+            return output
+        return await run_stage(self, self.build_prompt(query))
+
+    async def fan_out(self, query: str) -> str:
+        split = await Runner.run(topic_splitter, query)
+        topics = [t.strip() for t in split.final_output.sub_topics if t.strip()][:RESEARCH_FANOUT]
+        if len(topics) <= 1:
+            # Narrow query: one focused call is as fast as fanning out
+            return await run_stage(self, self.build_prompt(query))
+
+        semaphore = asyncio.Semaphore(RESEARCH_CONCURRENCY)
+
+        async def research(topic: str) -> str:
+            async with semaphore:
+                # The deadline starts once the call holds a slot, so queued
+                # sub-topics are not penalised for waiting
+                return await asyncio.wait_for(
+                    run_stage(self, self.build_prompt(f"{topic} (as part of: {query}). Keep it to a short paragraph.")),
+                    RESEARCH_DEADLINE,
+                )
+
+        results = await asyncio.gather(*(research(t) for t in topics), return_exceptions=True)
+        sections = []
+        for topic, result in zip(topics, results):
+            if isinstance(result, BaseException):
+                # Stragglers past the deadline and failed calls are dropped
+                logger.warning("Research on %r dropped: %r", topic, result)
+                continue
+            sections.append(f"### {topic}\n{result}")
+        if not sections:
+            raise TimeoutError(f"No research sub-topic finished within {RESEARCH_DEADLINE}s")
+        return "\n\n".join(sections)
 
 class SummarizerAgent(Agent):
+    def build_prompt(self, info: str) -> str:
+        return f"You are a summarizer. Condense the following information into a short summary:\n{info}"
+
     async def run(self, info: str, **kwargs):
-        prompt = f"You are a summarizer. Condense the following information into a short summary:\n{info}"
-        result = await Runner.run(self, prompt)
-        if isinstance(result.final_output, str):
-            return result.final_output
-        return result.final_output.response
+        return await run_stage(self, self.build_prompt(info))
 
 class PlannerAgent(Agent):
+    def build_prompt(self, summary: str) -> str:
+        return f"You are a planner. Create a simple actionable plan based on the following summary:\n{summary}"
+
     async def run(self, summary: str, **kwargs):
-        prompt = f"You are a planner. Create a simple actionable plan based on the following summary:\n{summary}"
-        result = await Runner.run(self, prompt)
-        if isinstance(result.final_output, str):
-            return result.final_output
-        return result.final_output.response
+        return await run_stage(self, self.build_prompt(summary))
 
 
 # Instantiate agents with the Gemini model and output_type
-research_agent = ResearchAgent(name="ResearchAgent", model=model, output_type=AgentOutput)
-summarizer_agent = SummarizerAgent(name="SummarizerAgent", model=model, output_type=AgentOutput)
-planner_agent = PlannerAgent(name="PlannerAgent", model=model, output_type=AgentOutput)
+topic_splitter = Agent(
+    name="TopicSplitter",
+    instructions=(
+        f"Split the user's research query into at most {max(RESEARCH_FANOUT, 1)} independent sub-topics "
+        "that together cover it. Return a single sub-topic if the query is already narrow."
+    ),
+    model=model,
+    output_type=ResearchTopics,
+    hooks=usage_hooks,
+)
+research_agent = ResearchAgent(name="ResearchAgent", model=model, output_type=AgentOutput, hooks=usage_hooks)
+summarizer_agent = SummarizerAgent(name="SummarizerAgent", model=model, output_type=AgentOutput, hooks=usage_hooks)
+planner_agent = PlannerAgent(name="PlannerAgent", model=model, output_type=AgentOutput, hooks=usage_hooks)
+
+# Streaming mode: the AgentOutput JSON is streamed and only its `response`
+# text is shown
+STREAMING = os.getenv("COLLAB_STREAMING", "1") != "0"
+
+def build_stages(degraded: bool = False) -> list[PipelineStage]:
+    if degraded:
+        # Near the token budget: shorter stages and no summary, the plan
+        # works from the research directly
+        research, planner = brief(research_agent), brief(planner_agent)
+        return [
+            PipelineStage("Research", research, research.build_prompt, output_field="response"),
+            PipelineStage("Plan", planner, planner.build_prompt, output_field="response"),
+        ]
+    return [
+        PipelineStage("Research", research_agent, research_agent.build_prompt, output_field="response"),
+        PipelineStage("Summary", summarizer_agent, summarizer_agent.build_prompt, output_field="response"),
+        PipelineStage("Plan", planner_agent, planner_agent.build_prompt, output_field="response"),
+    ]
 
 # -----------------------------
-# 7️⃣ Chainlit interface
+# 3️⃣ Startup – warm Gemini connections before the first message
+# -----------------------------
+@cl.on_app_startup
+async def handle_app_startup():
+    await gemini_provider.warm_up()
+    await metrics.start()
+
+@cl.on_app_shutdown
+async def handle_app_shutdown():
+    await metrics.stop()
+    await gemini_provider.close()
+
+# -----------------------------
+# 4️⃣ Chainlit interface
 # -----------------------------
 @cl.on_chat_start
 async def chat_start():
     if cl.user_session.get("greeted"):
         return
     cl.user_session.set("greeted", True)
-    cl.user_session.set("history", [])
     await cl.Message(
         content="🤖 **Welcome!** I am a Multi-Agent Collaboration AI using Gemini API.\n\n"
                 "Send a query, and I will research, summarize, and create a plan step-by-step."
     ).send()
 
+@cl.on_chat_end
+async def chat_end():
+    ledger.release(cl.user_session.get("id"))
+
 @cl.on_message
+@timed("handler_seconds", app="multi_agent_collab")
+@on_busy(lambda text: cl.Message(content=text).send())
+# research (or split + one call per sub-topic) + summary + plan
+@call_budget(3 + RESEARCH_FANOUT if RESEARCH_FANOUT > 0 else 3)
+@track_session(lambda: cl.user_session.get("id"))
 async def handle_message(message: cl.Message):
-    history = cl.user_session.get("history")
+    level = budget_level()
+    if level == EXHAUSTED:
+        await cl.Message(content=BUDGET_MESSAGE).send()
+        return
 
-    # Save user input
-    history.append({"role": "user", "content": message.content})
+    if STREAMING:
+        # Each stage streams into its own message; the next one starts once
+        # enough of its input paragraphs are complete
+        async def open_section(stage: PipelineStage):
+            section = cl.Message(content=f"**{stage.label}:** ")
+            await section.send()
+            # Time to first token per stage is measured from the section opening
+            return MeteredFlush(section.stream_token, app="multi_agent_collab", stage=stage.label)
+
+        stages = build_stages(degraded=level != NORMAL)
+        query = message.content
+        if RESEARCH_FANOUT > 0 and level == NORMAL:
+            # Fan-out research is gathered, not streamed; the rest still pipelines
+            research_out = await research_agent.run(query)
+            await cl.Message(content=f"**Research:** {research_out}").send()
+            stages, query = stages[1:], research_out
+        await run_pipeline(stages, query, open_section)
+        return
+
+    if level != NORMAL:
+        # Near the token budget: shorter research, no summary stage
+        research_out = await brief(research_agent).run(message.content)
+        plan_out = await brief(planner_agent).run(research_out)
+        await cl.Message(content=f"**Research:** {research_out}\n\n**Plan:** {plan_out}").send()
+        return
 
     # Step 1: Research
     research_out = await research_agent.run(message.content)
@@ -119,6 +230,3 @@ async def handle_message(message: cl.Message):
         f"**Plan:** {plan_out}"
     )
     await cl.Message(content=final_response).send()
-
-    # Update session history
-    cl.user_session.set("history", history)
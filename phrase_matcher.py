@@ -0,0 +1,143 @@
+# phrase_matcher.py
+# Aho-Corasick multi-phrase matcher for keyword guardrails. One pass over the
+# text finds every lexicon phrase, so cost stays O(len(text)) however large
+# the lexicon grows. The streaming API keeps automaton state across chunks.
+import os
+from collections import deque
+from dataclasses import dataclass
+
+# -----------------------------
+# 1️⃣ Lexicon loading
+# -----------------------------
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexicons")
+SOLUTION_LEXICON = os.getenv("SOLUTION_LEXICON", os.path.join(LEXICON_DIR, "solution_phrases.txt"))
+
+def load_lexicon(path: str) -> list[str]:
+    # One phrase per line; blank lines and "#" comments are ignored
+    with open(path, encoding="utf-8") as f:
+        phrases = [line.split("#", 1)[0].strip() for line in f]
+    return [p for p in phrases if p]
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+@dataclass
+class Match:
+    phrase: str
+    start: int  # offset in the whole (streamed) text
+    end: int    # exclusive
+
+# -----------------------------
+# 2️⃣ Automaton
+# -----------------------------
+class PhraseMatcher:
+    def __init__(self, phrases: list[str], word_boundaries: bool = True):
+        self.phrases = [p.lower() for p in phrases]
+        self.word_boundaries = word_boundaries
+        self.max_len = max((len(p) for p in self.phrases), default=0)
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[tuple[int, ...]] = [()]
+        for index, phrase in enumerate(self.phrases):
+            self._insert(index, phrase)
+        self._link()
+
+    @classmethod
+    def from_file(cls, path: str, word_boundaries: bool = True) -> "PhraseMatcher":
+        return cls(load_lexicon(path), word_boundaries=word_boundaries)
+
+    def _insert(self, index: int, phrase: str) -> None:
+        node = 0
+        for ch in phrase:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        self._out[node] += (index,)
+
+    def _link(self) -> None:
+        # Breadth-first failure links; outputs inherit from their fail node
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] += self._out[self._fail[child]]
+
+    def step(self, node: int, ch: str) -> int:
+        while node and ch not in self._goto[node]:
+            node = self._fail[node]
+        return self._goto[node].get(ch, 0)
+
+    def stream(self) -> "MatcherStream":
+        return MatcherStream(self)
+
+    def find_all(self, text: str) -> list[Match]:
+        stream = self.stream()
+        return stream.feed(text) + stream.finish()
+
+    def search(self, text: str) -> bool:
+        stream = self.stream()
+        return bool(stream.feed(text, first_only=True) or stream.finish())
+
+# -----------------------------
+# 3️⃣ Streaming state
+# -----------------------------
+class MatcherStream:
+    def __init__(self, matcher: PhraseMatcher):
+        self.matcher = matcher
+        self.node = 0
+        self.position = 0
+        # Word-ness of the last max_len + 1 characters, for the boundary
+        # check before a match that started in an earlier chunk
+        self._recent = deque(maxlen=matcher.max_len + 1)
+        # Matches ending at the last character: need the next one (or the
+        # end of the stream) to confirm the trailing word boundary
+        self._pending: list[Match] = []
+
+    def _boundary_before(self, start: int) -> bool:
+        # _recent[-1] is the current character; look up the one before `start`
+        back = self.position - start + 1
+        if back >= len(self._recent):
+            return True  # match starts at the very beginning of the stream
+        return not self._recent[-1 - back]
+
+    def feed(self, chunk: str, first_only: bool = False) -> list[Match]:
+        matcher = self.matcher
+        found: list[Match] = []
+        for ch in chunk.lower():
+            is_word = _is_word(ch)
+            if self._pending:
+                if not is_word:
+                    found.extend(self._pending)
+                self._pending = []
+                if found and first_only:
+                    return found
+
+            self.node = matcher.step(self.node, ch)
+            self._recent.append(is_word)
+            for index in matcher._out[self.node]:
+                phrase = matcher.phrases[index]
+                start = self.position - len(phrase) + 1
+                match = Match(phrase, start, self.position + 1)
+                if not matcher.word_boundaries:
+                    found.append(match)
+                elif self._boundary_before(start):
+                    self._pending.append(match)
+            self.position += 1
+            if found and first_only:
+                return found
+        return found
+
+    def finish(self) -> list[Match]:
+        found, self._pending = self._pending, []
+        return found
@@ -0,0 +1,22 @@
+# quiz_agent.py
+# The quiz agent shared by the generate_quiz app and the offline tools
+# (quiz_batch.py). No Chainlit import, so command-line tools can use it
+# without loading an app module.
+from agents import Agent
+from gemini_provider import model
+from token_usage import usage_hooks
+
+# -----------------------------
+# 1️⃣ Agent – Math Quiz & Homework Generator
+# -----------------------------
+agent_quiz: Agent = Agent(
+    name="Math Quiz & Homework Generator",
+    instructions=(
+        "You are a math assistant. You can generate math quizzes or help with math homework. "
+        "If the user asks for a quiz, create 3 multiple-choice math questions with 4 options each and mark the correct answer. "
+        "If the user asks for homework help, solve the problem step by step clearly. "
+        "Topics include algebra, arithmetic, and geometry."
+    ),
+    model=model,
+    hooks=usage_hooks,
+)
@@ -0,0 +1,302 @@
+# quiz_bank.py
+# Pre-generated quiz questions indexed by (topic, difficulty). Quiz requests
+# are parsed locally and served straight from the bank; a background worker
+# refills low buckets through the quiz agent while the app is quiet, and a
+# miss falls back to the normal live generation.
+import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Any
+from pydantic import BaseModel
+from agents import Agent, Runner
+from answer_verifier import repair
+from call_budget import background_task
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# 1️⃣ Settings
+# -----------------------------
+QUIZ_BANK_ENABLED = os.getenv("QUIZ_BANK_ENABLED", "1") != "0"
+QUIZ_BANK_DB = os.getenv("QUIZ_BANK_DB", "quiz_bank.db")
+QUIZ_BANK_TARGET = int(os.getenv("QUIZ_BANK_TARGET", "30"))        # servable questions per bucket
+QUIZ_BANK_LOW_WATER = int(os.getenv("QUIZ_BANK_LOW_WATER", "9"))   # refill below this
+QUIZ_BANK_BATCH = int(os.getenv("QUIZ_BANK_BATCH", "6"))           # questions per refill call
+QUIZ_BANK_MAX_SERVES = int(os.getenv("QUIZ_BANK_MAX_SERVES", "20"))  # retire a question after this
+QUIZ_BANK_QUIET_SECONDS = float(os.getenv("QUIZ_BANK_QUIET_SECONDS", "5"))
+QUIZ_BANK_REFILL_INTERVAL = float(os.getenv("QUIZ_BANK_REFILL_INTERVAL", "10"))
+
+TOPICS = ("algebra", "arithmetic", "geometry")
+DIFFICULTIES = ("easy", "medium", "hard")
+DEFAULT_QUESTIONS = 3
+MAX_QUESTIONS = 10
+
+# -----------------------------
+# 2️⃣ Question schema & validation
+# -----------------------------
+class QuizQuestion(BaseModel):
+    question: str
+    options: list[str]
+    answer_index: int   # 0-3, index into options
+
+class QuizBatch(BaseModel):
+    questions: list[QuizQuestion]
+
+def is_valid(question: QuizQuestion) -> bool:
+    options = [o.strip() for o in question.options]
+    return (
+        bool(question.question.strip())
+        and len(options) == 4
+        and all(options)
+        and len({o.lower() for o in options}) == 4
+        and 0 <= question.answer_index < 4
+    )
+
+def render_quiz(topic: str | None, difficulty: str, questions: list[QuizQuestion]) -> str:
+    title = f"{topic.capitalize()} quiz" if topic else "Math quiz"
+    lines = [f"**{title} ({difficulty})**", ""]
+    for n, q in enumerate(questions, 1):
+        lines.append(f"{n}. {q.question}")
+        lines.extend(f"   {'ABCD'[i]}) {option}" for i, option in enumerate(q.options))
+        lines.append(f"   **Correct answer:** {'ABCD'[q.answer_index]}")
+        lines.append("")
+    return "\n".join(lines).rstrip()
+
+# -----------------------------
+# 3️⃣ Local request parsing
+# -----------------------------
+_QUIZ = re.compile(r"\b(quiz(zes)?|mcqs?|multiple[- ]choice|practice questions?)\b")
+_COUNT = re.compile(r"\b(\d{1,2})\s+(?:[a-z-]+\s+){0,2}(questions?|mcqs?)\b")
+_HELP = re.compile(r"\b(solve|explain|help me|homework|what is|how do)\b")
+_TOPIC_WORDS = {
+    "algebra": r"algebra\w*|equations?|linear|quadratic|polynomials?|variables?",
+    "arithmetic": r"arithmetic|addition|subtraction|multiplication|division|fractions?|decimals?|percent\w*",
+    "geometry": r"geometry|triangles?|angles?|circles?|areas?|perimeters?|polygons?|shapes?",
+}
+_TOPICS = {topic: re.compile(rf"\b({words})\b") for topic, words in _TOPIC_WORDS.items()}
+_DIFFICULTY_WORDS = {
+    "easy": ("easy", "simple", "basic", "beginner", "beginners"),
+    "medium": ("medium", "intermediate", "moderate"),
+    "hard": ("hard", "difficult", "advanced", "challenging", "tough"),
+}
+_DIFFICULTY = {d: re.compile(rf"\b({'|'.join(words)})\b") for d, words in _DIFFICULTY_WORDS.items()}
+# Words a generic "give me a quick math quiz" may contain besides the topic
+_GENERIC = set(
+    "a an the me us some my our please pls can could you give create make generate send want need "
+    "i would like quick short new another more math maths mathematics on about for with of and "
+    "grade level quiz quizzes mcq mcqs multiple choice practice question questions".split()
+) | {w for words in _DIFFICULTY_WORDS.values() for w in words}
+
+@dataclass
+class QuizRequest:
+    topic: str | None     # None = any of TOPICS
+    difficulty: str
+    count: int
+
+def parse_quiz_request(text: str) -> QuizRequest | None:
+    # Only clear quiz requests are served from the bank; everything else
+    # (homework help, unknown topics) goes to the live agent
+    text = text.lower()
+    count_match = _COUNT.search(text)
+    if not (_QUIZ.search(text) or count_match) or _HELP.search(text):
+        return None
+    topics = [t for t, pattern in _TOPICS.items() if pattern.search(text)]
+    if len(topics) > 1:
+        return None
+    if not topics:
+        words = re.findall(r"[a-z]+", text)
+        if any(w not in _GENERIC for w in words):
+            return None   # e.g. "a calculus quiz": not a topic the bank holds
+    difficulty = next((d for d, pattern in _DIFFICULTY.items() if pattern.search(text)), "medium")
+    count = int(count_match.group(1)) if count_match else DEFAULT_QUESTIONS
+    if not 1 <= count <= MAX_QUESTIONS:
+        return None
+    return QuizRequest(topics[0] if topics else None, difficulty, count)
+
+# -----------------------------
+# 4️⃣ Bank – SQLite store + refill worker
+# -----------------------------
+BANK_INSTRUCTIONS = (
+    "You write multiple-choice math quiz questions for a question bank. "
+    "Each question has exactly 4 distinct options and exactly one correct option; "
+    "answer_index is the 0-based index of that option. Questions must be self-contained, "
+    "unambiguous and solvable without a calculator."
+)
+
+class QuizBank:
+    def __init__(self, path: str = QUIZ_BANK_DB, target: int = QUIZ_BANK_TARGET,
+                 low_water: int = QUIZ_BANK_LOW_WATER, max_serves: int = QUIZ_BANK_MAX_SERVES):
+        self.target = target
+        self.low_water = low_water
+        self.max_serves = max_serves
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self._last_activity = 0.0
+        self._filling: set[tuple[str, str]] = set()
+        self._worker: asyncio.Task | None = None
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS questions ("
+            " id INTEGER PRIMARY KEY, topic TEXT NOT NULL, difficulty TEXT NOT NULL,"
+            " fingerprint TEXT NOT NULL UNIQUE, payload TEXT NOT NULL,"
+            " served INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS questions_bucket ON questions (topic, difficulty, served)")
+
+    # -- serving --------------------------------------------------------
+    def touch(self) -> None:
+        # Called per user message; the refill worker only runs when quiet
+        self._last_activity = time.monotonic()
+
+    def take(self, request: QuizRequest, exclude: set[int] = frozenset()) -> list[tuple[int, QuizQuestion]] | None:
+        topics = [request.topic] if request.topic else list(TOPICS)
+        marks = ",".join("?" * len(topics))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, payload FROM questions WHERE topic IN ({marks}) AND difficulty = ? AND served < ?"
+                " ORDER BY served, RANDOM() LIMIT ?",
+                (*topics, request.difficulty, self.max_serves, request.count + len(exclude)),
+            ).fetchall()
+            picked = [(qid, payload) for qid, payload in rows if qid not in exclude][:request.count]
+            if len(picked) < request.count:
+                self.misses += 1
+                return None
+            self._db.executemany("UPDATE questions SET served = served + 1 WHERE id = ?", [(qid,) for qid, _ in picked])
+        self.hits += 1
+        return [(qid, QuizQuestion.model_validate_json(payload)) for qid, payload in picked]
+
+    # -- stocking -------------------------------------------------------
+    def add(self, topic: str, difficulty: str, questions: list[QuizQuestion]) -> int:
+        added = 0
+        with self._lock:
+            for q in questions:
+                # Structural check, then the local answer-key check: wrong keys
+                # are corrected, items with no / several right options dropped
+                q = repair(q) if is_valid(q) else None
+                if q is None:
+                    self.rejected += 1
+                    continue
+                fingerprint = hashlib.sha256(" ".join(q.question.lower().split()).encode()).hexdigest()
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO questions (topic, difficulty, fingerprint, payload, created_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (topic, difficulty, fingerprint, q.model_dump_json(), time.time()),
+                )
+                added += cursor.rowcount
+        return added
+
+    def items(self):
+        # (id, topic, difficulty, question) for every stored question
+        with self._lock:
+            rows = self._db.execute("SELECT id, topic, difficulty, payload FROM questions").fetchall()
+        for qid, topic, difficulty, payload in rows:
+            yield qid, topic, difficulty, QuizQuestion.model_validate_json(payload)
+
+    def replace(self, qid: int, question: QuizQuestion | None) -> None:
+        # None deletes the question
+        with self._lock:
+            if question is None:
+                self._db.execute("DELETE FROM questions WHERE id = ?", (qid,))
+            else:
+                self._db.execute("UPDATE questions SET payload = ? WHERE id = ?", (question.model_dump_json(), qid))
+
+    def stock(self) -> dict[tuple[str, str], int]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT topic, difficulty, COUNT(*) FROM questions WHERE served < ? GROUP BY topic, difficulty",
+                (self.max_serves,),
+            ).fetchall()
+        counts = {(t, d): 0 for t in TOPICS for d in DIFFICULTIES}
+        counts.update({(t, d): n for t, d, n in rows})
+        return counts
+
+    def low_buckets(self) -> list[tuple[str, str]]:
+        # A bucket starts refilling below low_water and stops at target,
+        # emptiest first
+        stock = self.stock()
+        for bucket, n in stock.items():
+            if n < self.low_water:
+                self._filling.add(bucket)
+            elif n >= self.target:
+                self._filling.discard(bucket)
+        return sorted(self._filling, key=stock.get)
+
+    async def refill(self, generator: Agent, topic: str, difficulty: str, count: int = QUIZ_BANK_BATCH) -> int:
+        prompt = f"Write {count} {difficulty} {topic} multiple-choice questions."
+        result = await Runner.run(generator, prompt)
+        added = self.add(topic, difficulty, result.final_output.questions)
+        logger.info("Quiz bank: +%d %s/%s questions", added, topic, difficulty)
+        return added
+
+    async def _refill_loop(self, generator: Agent) -> None:
+        while True:
+            await asyncio.sleep(QUIZ_BANK_REFILL_INTERVAL)
+            if time.monotonic() - self._last_activity < QUIZ_BANK_QUIET_SECONDS:
+                continue
+            # Top up the emptiest bucket while it is quiet, one call per tick
+            for topic, difficulty in self.low_buckets()[:1]:
+                try:
+                    await self.refill(generator, topic, difficulty)
+                except Exception as e:
+                    logger.warning("Quiz bank refill for %s/%s failed: %s", topic, difficulty, e)
+
+    def start_refill(self, quiz_agent: Agent) -> None:
+        # Idempotent: several apps in one process share one worker
+        if self._worker is None or self._worker.done():
+            self._worker = background_task(self._refill_loop(generator_for(quiz_agent)))
+
+    def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "rejected": self.rejected,
+            "stock": {f"{t}/{d}": n for (t, d), n in self.stock().items()},
+        }
+
+def generator_for(quiz_agent: Agent) -> Agent:
+    # Same model and settings as the app's quiz agent, structured for the bank
+    return quiz_agent.clone(
+        name=f"{quiz_agent.name} (quiz bank)",
+        instructions=BANK_INSTRUCTIONS,
+        output_type=QuizBatch,
+        input_guardrails=[],
+        output_guardrails=[],
+    )
+
+# Shared process-wide bank
+quiz_bank = QuizBank()
+
+# -----------------------------
+# 5️⃣ Serving helper for handlers
+# -----------------------------
+def serve_quiz(text: str, seen: set[int]) -> str | None:
+    # Returns the rendered quiz, or None to fall back to live generation.
+    # `seen` holds question ids already shown in this session.
+    quiz_bank.touch()
+    if not QUIZ_BANK_ENABLED:
+        return None
+    request = parse_quiz_request(text)
+    if request is None:
+        return None
+    picked = quiz_bank.take(request, exclude=seen)
+    if picked is None:
+        return None
+    seen.update(qid for qid, _ in picked)
+    return render_quiz(request.topic, request.difficulty, [q for _, q in picked])
@@ -0,0 +1,222 @@
+# quiz_batch.py
+# Bulk offline quiz generation. Reads a JSONL spec of {"topic", "difficulty",
+# "count"} lines, generates `count` quizzes per line with the quiz agent
+# through a rate-limited asyncio worker pool and appends them to a JSONL
+# output that doubles as the checkpoint: re-running skips finished quizzes.
+# The pool calls the bare Gemini model (metered only): the app's scheduler
+# and retry layers would queue and retry behind the rate limiter's back.
+#
+#   python quiz_batch.py catalog.jsonl -o quizzes.jsonl --rpm 900 --tpm 1000000 --workers 32
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+from dataclasses import dataclass, field
+from typing import Any
+import openai
+from agents import Agent, Runner, RunConfig
+import gemini_provider
+from metrics import MeteredModel
+from quiz_agent import agent_quiz
+from answer_verifier import repair
+from quiz_bank import generator_for, is_valid
+from rate_limit import RateLimiter
+
+logger = logging.getLogger("quiz_batch")
+
+QUESTIONS_PER_QUIZ = 3
+QUESTION_TOKENS = 80   # rough output size of one question, for the TPM estimate
+MAX_ATTEMPTS = 5
+
+# -----------------------------
+# 1️⃣ Jobs & checkpoint
+# -----------------------------
+@dataclass
+class Job:
+    job_id: str
+    topic: str
+    difficulty: str
+    attempts: int = 0
+
+def load_jobs(spec_path: str) -> list[Job]:
+    jobs = []
+    with open(spec_path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            spec = json.loads(line)
+            # Stable ids so a resumed run recognises finished quizzes
+            spec_id = spec.get("id", f"line{line_no}")
+            for n in range(int(spec.get("count", 1))):
+                jobs.append(Job(f"{spec_id}:{n}", spec["topic"], spec.get("difficulty", "medium")))
+    return jobs
+
+def finished_jobs(output_path: str) -> set[str]:
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["job_id"])
+            except (ValueError, KeyError):
+                continue   # torn last line from an interrupted run
+    return done
+
+# -----------------------------
+# 2️⃣ Throughput report
+# -----------------------------
+@dataclass
+class Progress:
+    total: int
+    skipped: int
+    done: int = 0
+    failed: int = 0
+    requests: int = 0
+    tokens: int = 0
+    rate_limited: int = 0
+    retries: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    def report(self) -> dict[str, Any]:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        remaining = self.total - self.skipped - self.done - self.failed
+        rate = self.done / elapsed
+        return {
+            "done": self.done,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "remaining": remaining,
+            "elapsed_s": round(elapsed, 1),
+            "quizzes_per_s": round(rate, 2),
+            "requests_per_min": round(self.requests * 60 / elapsed, 1),
+            "tokens_per_min": round(self.tokens * 60 / elapsed),
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+            "eta_s": round(remaining / rate) if rate else None,
+        }
+
+# -----------------------------
+# 3️⃣ Worker pool
+# -----------------------------
+def _retry_after(error: openai.APIStatusError) -> float | None:
+    value = error.response.headers.get("retry-after") if error.response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+async def generate_one(job: Job, generator: Agent, limiter: RateLimiter, run_config, progress: Progress) -> dict[str, Any]:
+    prompt = f"Write {QUESTIONS_PER_QUIZ} {job.difficulty} {job.topic} multiple-choice questions."
+    estimate = (len(str(generator.instructions)) + len(prompt)) // 4 + QUESTIONS_PER_QUIZ * QUESTION_TOKENS
+    await limiter.acquire(estimate)
+    progress.requests += 1
+    result = await Runner.run(generator, prompt, run_config=run_config)
+    used = result.context_wrapper.usage.total_tokens or estimate
+    limiter.settle(estimate, used)
+    progress.tokens += used
+
+    # Bad answer keys are fixed locally; unfixable items make the job retry
+    questions = [q for q in map(repair, filter(is_valid, result.final_output.questions)) if q is not None]
+    if len(questions) < QUESTIONS_PER_QUIZ:
+        raise ValueError(f"only {len(questions)} valid questions")
+    return {
+        "job_id": job.job_id,
+        "topic": job.topic,
+        "difficulty": job.difficulty,
+        "questions": [q.model_dump() for q in questions[:QUESTIONS_PER_QUIZ]],
+        "tokens": used,
+        "generated_at": time.time(),
+    }
+
+async def worker(queue: asyncio.Queue, generator: Agent, limiter: RateLimiter, run_config, out, progress: Progress) -> None:
+    while True:
+        job = await queue.get()
+        try:
+            job.attempts += 1
+            record = await generate_one(job, generator, limiter, run_config, progress)
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            progress.done += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            backoff = min(60.0, 2 ** job.attempts) * random.uniform(0.5, 1.0)
+            if isinstance(e, openai.RateLimitError):
+                # Everyone backs off, honouring Retry-After when given
+                progress.rate_limited += 1
+                limiter.cool_down(_retry_after(e) or backoff)
+            if job.attempts < MAX_ATTEMPTS:
+                progress.retries += 1
+                logger.info("Retrying %s after %s", job.job_id, e)
+                await asyncio.sleep(0 if isinstance(e, openai.RateLimitError) else backoff)
+                queue.put_nowait(job)
+            else:
+                progress.failed += 1
+                logger.warning("Giving up on %s: %s", job.job_id, e)
+        finally:
+            queue.task_done()
+
+async def run_batch(args: argparse.Namespace) -> Progress:
+    jobs = load_jobs(args.spec)
+    done = finished_jobs(args.output)
+    pending = [job for job in jobs if job.job_id not in done]
+    progress = Progress(total=len(jobs), skipped=len(jobs) - len(pending))
+    logger.info("%d quizzes in spec, %d already done, %d to generate", len(jobs), progress.skipped, len(pending))
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for job in pending:
+        queue.put_nowait(job)
+    limiter = RateLimiter(rpm=args.rpm, tpm=args.tpm)
+    # RateLimiter is the only limiter: 429s reach the workers (and cool_down)
+    # instead of being retried by ResilientModel or queued by the scheduler
+    batch_model = MeteredModel(gemini_provider.base_model, "quiz_batch")
+    generator = generator_for(agent_quiz).clone(model=batch_model)
+    run_config = RunConfig(model=batch_model, model_provider=gemini_provider.provider, tracing_disabled=True)
+
+    await gemini_provider.warm_up(min(args.workers, gemini_provider.WARM_CONNECTIONS))
+    with open(args.output, "a", encoding="utf-8") as out:
+        workers = [
+            asyncio.create_task(worker(queue, generator, limiter, run_config, out, progress))
+            for _ in range(args.workers)
+        ]
+
+        async def report_loop():
+            while True:
+                await asyncio.sleep(args.report_every)
+                logger.info("progress %s", json.dumps(progress.report()))
+
+        reporter = asyncio.create_task(report_loop())
+        try:
+            await queue.join()
+        finally:
+            for task in (*workers, reporter):
+                task.cancel()
+            await asyncio.gather(*workers, reporter, return_exceptions=True)
+            await gemini_provider.close()
+    return progress
+
+# -----------------------------
+# 4️⃣ CLI
+# -----------------------------
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate quizzes in bulk from a JSONL spec")
+    parser.add_argument("spec", help='JSONL lines like {"topic": "fractions", "difficulty": "easy", "count": 100}')
+    parser.add_argument("-o", "--output", default="quizzes.jsonl", help="JSONL output, also the resume checkpoint")
+    parser.add_argument("--workers", type=int, default=16, help="concurrent generations")
+    parser.add_argument("--rpm", type=float, default=float(os.getenv("GEMINI_RPM", "0")), help="requests per minute (0 = unlimited)")
+    parser.add_argument("--tpm", type=float, default=float(os.getenv("GEMINI_TPM", "0")), help="tokens per minute (0 = unlimited)")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    progress = asyncio.run(run_batch(args))
+    print(json.dumps(progress.report()))
+    sys.exit(1 if progress.failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# rate_limit.py
+# Requests-per-minute / tokens-per-minute limiter for model calls. Two token
+# buckets refilled continuously; callers wait in FIFO order, so throughput at
+# the limit is a steady stream instead of bursts followed by 429s.
+import time
+import asyncio
+from dataclasses import dataclass, field
+
+# -----------------------------
+# 1️⃣ Token bucket
+# -----------------------------
+@dataclass
+class TokenBucket:
+    per_minute: float
+    burst_seconds: float = 5.0    # how much unused rate may pile up
+    level: float = field(init=False)
+    updated: float = field(init=False)
+
+    def __post_init__(self):
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.per_minute * self.burst_seconds / 60)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        # A request larger than the bucket only needs a full bucket
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing * 60 / self.per_minute)
+
+    def take(self, amount: float) -> None:
+        # May go negative: the debt delays the next callers
+        self._refill()
+        self.level -= amount
+
+# -----------------------------
+# 2️⃣ RPM / TPM limiter
+# -----------------------------
+class RateLimiter:
+    def __init__(self, rpm: float = 0, tpm: float = 0, burst_seconds: float = 5.0):
+        # 0 disables that limit
+        self.requests = TokenBucket(rpm, burst_seconds) if rpm else None
+        self.tokens = TokenBucket(tpm, burst_seconds) if tpm else None
+        self.waited = 0.0
+        self._cooldown_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 0) -> float:
+        # Returns the seconds spent waiting; the lock keeps waiters in order
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                wait = self._cooldown_until - time.monotonic()
+                if self.requests is not None:
+                    wait = max(wait, self.requests.wait_time(1))
+                if self.tokens is not None and tokens:
+                    wait = max(wait, self.tokens.wait_time(tokens))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None and tokens:
+                self.tokens.take(tokens)
+        waited = time.monotonic() - start
+        self.waited += waited
+        return waited
+
+    def settle(self, estimated: float, actual: float) -> None:
+        # Correct the token bucket once the real usage is known
+        if self.tokens is not None:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated - actual)
+
+    def cool_down(self, seconds: float) -> None:
+        # After a 429 every caller pauses, not just the one that was rejected
+        self._cooldown_until = max(self._cooldown_until, time.monotonic() + seconds)
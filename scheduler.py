@@ -0,0 +1,230 @@
+# scheduler.py
+# Process-wide scheduler in front of the Gemini model. Every model call waits
+# for admission: token buckets keep requests and tokens per minute under the
+# quota, priority classes let guardrail checks overtake long generations,
+# and bounded per-class queues reject new work with SchedulerBusy instead of
+# piling up behind a 429 storm. Queue waits are recorded per class.
+import os
+import json
+import time
+import heapq
+import asyncio
+import logging
+import functools
+import itertools
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Awaitable, Callable
+from agents import Model
+from call_budget import current_budget
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# 1️⃣ Settings
+# -----------------------------
+SCHEDULER_RPM = float(os.getenv("SCHEDULER_RPM", "0"))                 # 0 = no request limit
+SCHEDULER_TPM = float(os.getenv("SCHEDULER_TPM", "0"))                 # 0 = no token limit
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "64"))
+SCHEDULER_BURST_SECONDS = float(os.getenv("SCHEDULER_BURST_SECONDS", "2"))
+# Expected completion size when a call sets no max_tokens
+SCHEDULER_OUTPUT_TOKENS = int(os.getenv("SCHEDULER_OUTPUT_TOKENS", "500"))
+
+class Priority(IntEnum):
+    GUARDRAIL = 0      # short classifier calls gating a reply
+    INTERACTIVE = 1    # answers a user is waiting for
+    BACKGROUND = 2     # summaries, refills, batch jobs
+
+# Waiting calls allowed per class before new ones are rejected
+QUEUE_LIMITS = {
+    Priority.GUARDRAIL: int(os.getenv("SCHEDULER_QUEUE_GUARDRAIL", "200")),
+    Priority.INTERACTIVE: int(os.getenv("SCHEDULER_QUEUE_INTERACTIVE", "100")),
+    Priority.BACKGROUND: int(os.getenv("SCHEDULER_QUEUE_BACKGROUND", "50")),
+}
+
+BUSY_MESSAGE = "⏳ The assistant is busy right now. Please try again in a few seconds."
+
+class SchedulerBusy(RuntimeError):
+    pass
+
+# -----------------------------
+# 2️⃣ Queue-wait metrics
+# -----------------------------
+@dataclass
+class ClassStats:
+    admitted: int = 0
+    rejected: int = 0
+    waiting: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    recent_waits: deque = field(default_factory=lambda: deque(maxlen=1000))
+
+    def record(self, wait: float) -> None:
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent_waits.append(wait)
+
+    def summary(self) -> dict[str, Any]:
+        waits = sorted(self.recent_waits)
+        pick = lambda pct: waits[min(len(waits) - 1, int(pct / 100 * len(waits)))] if waits else 0.0
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "waiting": self.waiting,
+            "wait_avg_ms": round(1000 * self.total_wait / self.admitted, 1) if self.admitted else 0.0,
+            "wait_p50_ms": round(1000 * pick(50), 1),
+            "wait_p95_ms": round(1000 * pick(95), 1),
+            "wait_max_ms": round(1000 * self.max_wait, 1),
+        }
+
+# -----------------------------
+# 3️⃣ Scheduler
+# -----------------------------
+class Scheduler:
+    def __init__(self, rpm: float = SCHEDULER_RPM, tpm: float = SCHEDULER_TPM,
+                 max_concurrency: int = SCHEDULER_MAX_CONCURRENCY, burst_seconds: float = SCHEDULER_BURST_SECONDS,
+                 queue_limits: dict[Priority, int] = QUEUE_LIMITS):
+        self.requests = TokenBucket(rpm, burst_seconds) if rpm else None
+        self.tokens = TokenBucket(tpm, burst_seconds) if tpm else None
+        self.max_concurrency = max_concurrency
+        self.queue_limits = dict(queue_limits)
+        self.in_flight = 0
+        self.stats = {p: ClassStats() for p in Priority}
+        self._heap: list[tuple[int, int, asyncio.Future, float]] = []
+        self._seq = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    @property
+    def queued(self) -> int:
+        return len(self._heap)
+
+    def saturated(self, priority: Priority) -> bool:
+        return self.stats[priority].waiting >= self.queue_limits[priority]
+
+    async def acquire(self, priority: Priority, tokens: int) -> None:
+        stats = self.stats[priority]
+        if self.saturated(priority):
+            stats.rejected += 1
+            raise SchedulerBusy(f"{priority.name.lower()} queue is full ({stats.waiting} waiting)")
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), future, tokens))
+        stats.waiting += 1
+        start = time.monotonic()
+        self._pump()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()   # admitted just as the caller gave up
+            raise
+        finally:
+            stats.waiting -= 1
+        stats.record(time.monotonic() - start)
+
+    def release(self, estimated: int = 0, actual: int | None = None) -> None:
+        self.in_flight -= 1
+        if self.tokens is not None and actual is not None:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated - actual)
+        self._pump()
+
+    def _pump(self) -> None:
+        # Admit waiters in (priority, arrival) order while capacity lasts
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._heap and self.in_flight < self.max_concurrency:
+            priority, _, future, tokens = self._heap[0]
+            if future.done():
+                heapq.heappop(self._heap)   # caller was cancelled while queued
+                continue
+            wait = 0.0
+            if self.requests is not None:
+                wait = max(wait, self.requests.wait_time(1))
+            if self.tokens is not None:
+                wait = max(wait, self.tokens.wait_time(tokens))
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._pump)
+                return
+            heapq.heappop(self._heap)
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            **{p.name.lower(): s.summary() for p, s in self.stats.items()},
+        }
+
+# Shared process-wide scheduler, configured from the environment
+scheduler = Scheduler()
+
+# -----------------------------
+# 4️⃣ Scheduled model wrapper
+# -----------------------------
+def _estimate_tokens(system_instructions: str | None, input: Any, model_settings: Any) -> int:
+    text = (system_instructions or "") + (input if isinstance(input, str) else json.dumps(input, default=str))
+    output = getattr(model_settings, "max_tokens", None) or SCHEDULER_OUTPUT_TOKENS
+    return len(text) // 4 + output
+
+class ScheduledModel(Model):
+    # priority=None: INTERACTIVE inside a handler, BACKGROUND for work started
+    # outside one (background_task(), batch scripts)
+    def __init__(self, inner: Model, priority: Priority | None = None, sched: Scheduler | None = None):
+        self.inner = inner
+        self.priority = priority
+        self.scheduler = sched
+
+    def _priority(self) -> Priority:
+        if self.priority is not None:
+            return self.priority
+        return Priority.INTERACTIVE if current_budget() is not None else Priority.BACKGROUND
+
+    async def get_response(self, system_instructions, input, model_settings, *args, **kwargs):
+        sched = self.scheduler or scheduler
+        estimate = _estimate_tokens(system_instructions, input, model_settings)
+        await sched.acquire(self._priority(), estimate)
+        actual = None
+        try:
+            response = await self.inner.get_response(system_instructions, input, model_settings, *args, **kwargs)
+            actual = response.usage.total_tokens or None
+            return response
+        finally:
+            sched.release(estimate, actual)
+
+    async def stream_response(self, system_instructions, input, model_settings, *args, **kwargs):
+        sched = self.scheduler or scheduler
+        estimate = _estimate_tokens(system_instructions, input, model_settings)
+        await sched.acquire(self._priority(), estimate)
+        actual = None
+        try:
+            async for event in self.inner.stream_response(system_instructions, input, model_settings, *args, **kwargs):
+                if event.type == "response.completed" and event.response.usage is not None:
+                    actual = event.response.usage.total_tokens or None
+                yield event
+        finally:
+            sched.release(estimate, actual)
+
+# -----------------------------
+# 5️⃣ Backpressure in handlers
+# -----------------------------
+def on_busy(notify: Callable[[str], Awaitable[Any]], message: str = BUSY_MESSAGE):
+    # Turns SchedulerBusy into a short notice for the user instead of an error:
+    #   @on_busy(lambda text: cl.Message(content=text).send())
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except SchedulerBusy as e:
+                logger.warning("%s rejected: %s", func.__name__, e)
+                await notify(message)
+        return wrapper
+    return decorator
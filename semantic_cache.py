@@ -0,0 +1,226 @@
+# semantic_cache.py
+# Local cache of agent answers keyed on what a message means rather than its
+# exact text. Messages are embedded on the CPU with a hashed character n-gram
+# vectorizer, kept as rows of a NumPy matrix and searched with one matrix-
+# vector product; a cached answer is served when the best cosine similarity
+# clears SEMANTIC_CACHE_THRESHOLD. The matrix can live in a memory-mapped
+# file so the cache survives restarts. Needs the optional `numpy` package
+# (`pip install numpy`); without it the cache is disabled.
+import os
+import re
+import json
+import time
+import zlib
+import asyncio
+import logging
+from typing import Any
+from metrics import metrics
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# -----------------------------
+# 1️⃣ Settings
+# -----------------------------
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") != "0" and np is not None
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))   # cosine similarity
+SEMANTIC_CACHE_CAPACITY = int(os.getenv("SEMANTIC_CACHE_CAPACITY", "5000"))      # answers per namespace
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "1024"))                # hashed feature space
+SEMANTIC_CACHE_MIN_CHARS = int(os.getenv("SEMANTIC_CACHE_MIN_CHARS", "6"))       # shorter messages bypass the cache
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "")                       # "" = memory only
+SEMANTIC_CACHE_SAVE_EVERY = int(os.getenv("SEMANTIC_CACHE_SAVE_EVERY", "50"))    # inserts between index saves
+
+# -----------------------------
+# 2️⃣ Hashed n-gram vectorizer
+# -----------------------------
+# Politeness and articles only: words that say what is wanted ("solve",
+# "what is", "help with") stay, so "solve X" and "what is X" differ
+FILLER_WORDS = frozenset(
+    "a an the pls plz please can could would you me my i hey hi hello thanks thank".split()
+)
+_WORD = re.compile(r"[a-z]+(?:'[a-z]+)?")
+_OPERATOR_SPACING = re.compile(r"\s*([-+*/^=<>()])\s*")
+_WHITESPACE = re.compile(r"\s+")
+# Numbers and operators: "2x+3=11" and "2x-3=12" must never share an answer,
+# however similar the rest of the message is
+_MATH_TOKEN = re.compile(r"\d+(?:\.\d+)?|[-+*/^=<>]")
+NGRAM_SIZES = (3, 4, 5)
+
+def normalize(text: str) -> str:
+    text = _OPERATOR_SPACING.sub(r"\1", text.lower())
+    text = _WORD.sub(lambda m: "" if m.group() in FILLER_WORDS else m.group(), text)
+    return _WHITESPACE.sub(" ", text).strip(" ?!.,")
+
+def signature(text: str) -> int:
+    # Only rows with the same math skeleton are compared
+    return zlib.crc32(" ".join(_MATH_TOKEN.findall(text)).encode())
+
+def vectorize(text: str, dim: int = SEMANTIC_CACHE_DIM) -> "np.ndarray | None":
+    # Signed feature hashing of character n-grams (crc32 is stable across
+    # processes, unlike hash()), L2-normalized so a dot product is the cosine
+    padded = f" {text} "
+    hashes = [
+        zlib.crc32(padded[i:i + n].encode())
+        for n in NGRAM_SIZES
+        for i in range(len(padded) - n + 1)
+    ]
+    if not hashes:
+        return None
+    hashes = np.asarray(hashes, dtype=np.uint32)
+    signs = np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32)
+    vector = np.zeros(dim, dtype=np.float32)
+    np.add.at(vector, hashes % dim, signs)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+# -----------------------------
+# 3️⃣ Matrix index
+# -----------------------------
+class SemanticCache:
+    def __init__(self, namespace: str, capacity: int = SEMANTIC_CACHE_CAPACITY, dim: int = SEMANTIC_CACHE_DIM,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD, path: str = SEMANTIC_CACHE_PATH,
+                 enabled: bool = SEMANTIC_CACHE_ENABLED):
+        self.namespace = namespace
+        self.capacity = capacity
+        self.dim = dim
+        self.threshold = threshold
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._unsaved = 0
+        self.size = 0
+        self.answers: list[str] = []
+        self._vectors_path = f"{path}.{namespace}.npy" if path else None
+        self._meta_path = f"{path}.{namespace}.json" if path else None
+        if not enabled:
+            return
+        # Row i holds the vector, math signature, last use and answer of entry i
+        self.signatures = np.zeros(capacity, dtype=np.int64)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.vectors = self._open_vectors()
+
+    def _open_vectors(self) -> "np.ndarray":
+        if self._vectors_path is None:
+            return np.zeros((self.capacity, self.dim), dtype=np.float32)
+        if os.path.exists(self._vectors_path) and os.path.exists(self._meta_path):
+            vectors = np.load(self._vectors_path, mmap_mode="r+")
+            with open(self._meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if vectors.shape == (self.capacity, self.dim) and meta.get("dim") == self.dim:
+                self.size = meta["size"]
+                self.answers = meta["answers"]
+                self.signatures[:self.size] = meta["signatures"]
+                self.last_used[:self.size] = meta["last_used"]
+                return vectors
+            logger.warning("Semantic cache %s was built with other settings; starting empty", self._vectors_path)
+        # Rows are written straight into the mapped file as answers are added
+        return np.lib.format.open_memmap(self._vectors_path, mode="w+", dtype=np.float32,
+                                         shape=(self.capacity, self.dim))
+
+    def _embed(self, text: str) -> tuple["np.ndarray | None", int]:
+        normalized = normalize(text)
+        if len(normalized) < SEMANTIC_CACHE_MIN_CHARS:
+            return None, 0
+        return vectorize(normalized, self.dim), signature(normalized)
+
+    def _search(self, vector: "np.ndarray", sig: int) -> tuple[int, float]:
+        # One matrix-vector product scores every row; rows with another math
+        # skeleton are masked out
+        scores = self.vectors[:self.size] @ vector
+        scores[self.signatures[:self.size] != sig] = -1.0
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+    def get(self, text: str) -> str | None:
+        if not self.enabled:
+            return None
+        vector, sig = self._embed(text)
+        if vector is None:
+            return None
+        with metrics.span("semantic_cache_search_seconds", namespace=self.namespace):
+            row, score = self._search(vector, sig) if self.size else (0, -1.0)
+        if score < self.threshold:
+            self.misses += 1
+            metrics.inc("semantic_cache_total", namespace=self.namespace, outcome="miss")
+            return None
+        self.hits += 1
+        metrics.inc("semantic_cache_total", namespace=self.namespace, outcome="hit")
+        self.last_used[row] = time.time()
+        return self.answers[row]
+
+    def put(self, text: str, answer: str) -> None:
+        if not self.enabled:
+            return
+        vector, sig = self._embed(text)
+        if vector is None:
+            return
+        row, score = self._search(vector, sig) if self.size else (0, -1.0)
+        if score < self.threshold:
+            if self.size < self.capacity:
+                row = self.size
+                self.size += 1
+                self.answers.append(answer)
+            else:
+                # Full: reuse the least recently used row
+                row = int(np.argmin(self.last_used))
+                self.evictions += 1
+                metrics.inc("semantic_cache_evictions_total", namespace=self.namespace)
+        self.vectors[row] = vector
+        self.signatures[row] = sig
+        self.last_used[row] = time.time()
+        self.answers[row] = answer
+        self._unsaved += 1
+        if self._meta_path and self._unsaved >= SEMANTIC_CACHE_SAVE_EVERY:
+            self._unsaved = 0
+            asyncio.get_running_loop().run_in_executor(None, self._write_meta, self._meta_snapshot())
+
+    # -----------------------------
+    # 4️⃣ Persistence
+    # -----------------------------
+    def _meta_snapshot(self) -> dict[str, Any]:
+        return {
+            "dim": self.dim,
+            "size": self.size,
+            "answers": list(self.answers),
+            "signatures": self.signatures[:self.size].tolist(),
+            "last_used": self.last_used[:self.size].tolist(),
+        }
+
+    def _write_meta(self, meta: dict[str, Any]) -> None:
+        self.vectors.flush()
+        tmp = f"{self._meta_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._meta_path)   # readers never see a half-written file
+
+    def save(self) -> None:
+        # On shutdown; the vectors are already in the mapped file
+        if self.enabled and self._meta_path:
+            self._write_meta(self._meta_snapshot())
+            self._unsaved = 0
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "entries": self.size,
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+# One cache per answering agent
+_caches: dict[str, SemanticCache] = {}
+
+def semantic_cache(namespace: str) -> SemanticCache:
+    cache = _caches.get(namespace)
+    if cache is None:
+        cache = _caches[namespace] = SemanticCache(namespace)
+    return cache
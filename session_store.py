@@ -0,0 +1,245 @@
+# session_store.py
+# Pluggable store for chat turns. The in-memory store keeps every turn in
+# RAM (the old behaviour); the SQLite store appends turns to a WAL database
+# and keeps only a short hot tail per active session in memory, loading older
+# turns lazily, evicting idle sessions from RAM and deleting sessions whose
+# last turn is older than SESSION_RETENTION_DAYS.
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")          # memory | sqlite
+SESSION_DB = os.getenv("SESSION_DB", "sessions.db")
+# At least the turns one prompt loads (history_manager's HISTORY_MAX_WINDOW),
+# so building a prompt never has to go to disk
+SESSION_HOT_TURNS = max(int(os.getenv("SESSION_HOT_TURNS", "40")), int(os.getenv("HISTORY_MAX_WINDOW", "40")))
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "900"))
+SESSION_RETENTION_DAYS = float(os.getenv("SESSION_RETENTION_DAYS", "30"))   # 0 = keep forever
+SESSION_PURGE_SECONDS = float(os.getenv("SESSION_PURGE_SECONDS", "3600"))   # between retention sweeps
+
+Turn = dict[str, Any]
+
+def _turn_bytes(turn: Turn) -> int:
+    # Approximate resident size: content plus a fixed per-dict overhead
+    content = turn.get("content", "")
+    return 200 + len(content if isinstance(content, str) else json.dumps(content))
+
+# -----------------------------
+# 1️⃣ In-memory store (default)
+# -----------------------------
+class MemorySessionStore:
+    def __init__(self):
+        self._sessions: dict[str, list[Turn]] = {}
+
+    def append(self, session_id: str, turn: Turn) -> int:
+        turns = self._sessions.setdefault(session_id, [])
+        turns.append(turn)
+        return len(turns) - 1
+
+    def replace(self, session_id: str, seq: int, turn: Turn) -> None:
+        turns = self._sessions.get(session_id)
+        if turns is not None and seq < len(turns):
+            turns[seq] = turn
+
+    def length(self, session_id: str) -> int:
+        return len(self._sessions.get(session_id, ()))
+
+    def tail(self, session_id: str, n: int) -> list[Turn]:
+        return self._sessions.get(session_id, [])[-n:] if n > 0 else []
+
+    def range(self, session_id: str, start: int, end: int) -> list[Turn]:
+        return self._sessions.get(session_id, [])[start:end]
+
+    def release(self, session_id: str) -> None:
+        # Nothing else can read an in-memory session once its chat has ended
+        self._sessions.pop(session_id, None)
+
+    def delete(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+    def evict_idle(self) -> int:
+        return 0
+
+    def purge_expired(self) -> int:
+        return 0
+
+    def memory_usage(self, session_id: str) -> int:
+        return sum(_turn_bytes(t) for t in self._sessions.get(session_id, ()))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": "memory",
+            "sessions_in_ram": len(self._sessions),
+            "turns_in_ram": sum(len(t) for t in self._sessions.values()),
+            "bytes_in_ram": sum(self.memory_usage(s) for s in self._sessions),
+        }
+
+# -----------------------------
+# 2️⃣ SQLite store – append-only, hot tail in RAM
+# -----------------------------
+@dataclass
+class _HotSession:
+    length: int
+    tail: deque = field(default_factory=deque)   # (seq, turn), newest last
+    last_access: float = field(default_factory=time.monotonic)
+    bytes: int = 0
+
+class SqliteSessionStore:
+    def __init__(self, path: str = SESSION_DB, hot_turns: int = SESSION_HOT_TURNS,
+                 idle_seconds: float = SESSION_IDLE_SECONDS, retention_days: float = SESSION_RETENTION_DAYS):
+        self.hot_turns = hot_turns
+        self.idle_seconds = idle_seconds
+        self.retention_days = retention_days
+        self.evicted = 0
+        self.purged = 0
+        self._hot: dict[str, _HotSession] = {}
+        self._last_sweep = time.monotonic()
+        self._last_purge = 0.0   # first sweep also purges what expired while the app was down
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            " session_id TEXT NOT NULL, seq INTEGER NOT NULL, turn TEXT NOT NULL, created_at REAL NOT NULL,"
+            " PRIMARY KEY (session_id, seq))"
+        )
+
+    def _session(self, session_id: str) -> _HotSession:
+        hot = self._hot.get(session_id)
+        if hot is None:
+            # Lazy load: only the turn count and the hot tail come back into RAM
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT seq, turn FROM turns WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+                    (session_id, self.hot_turns),
+                ).fetchall()
+            hot = _HotSession(length=rows[0][0] + 1 if rows else 0)
+            for seq, raw in reversed(rows):
+                turn = json.loads(raw)
+                hot.tail.append((seq, turn))
+                hot.bytes += _turn_bytes(turn)
+            self._hot[session_id] = hot
+        hot.last_access = time.monotonic()
+        return hot
+
+    def append(self, session_id: str, turn: Turn) -> int:
+        hot = self._session(session_id)
+        seq = hot.length
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO turns (session_id, seq, turn, created_at) VALUES (?, ?, ?, ?)",
+                (session_id, seq, json.dumps(turn), time.time()),
+            )
+        hot.length += 1
+        hot.tail.append((seq, turn))
+        hot.bytes += _turn_bytes(turn)
+        while len(hot.tail) > self.hot_turns:
+            _, dropped = hot.tail.popleft()
+            hot.bytes -= _turn_bytes(dropped)
+        self._maybe_sweep()
+        return seq
+
+    def replace(self, session_id: str, seq: int, turn: Turn) -> None:
+        # The only in-place edit, e.g. for a redacted answer
+        with self._lock:
+            self._db.execute(
+                "UPDATE turns SET turn = ? WHERE session_id = ? AND seq = ?",
+                (json.dumps(turn), session_id, seq),
+            )
+        hot = self._hot.get(session_id)
+        if hot is not None:
+            for i, (held_seq, held) in enumerate(hot.tail):
+                if held_seq == seq:
+                    hot.tail[i] = (seq, turn)
+                    hot.bytes += _turn_bytes(turn) - _turn_bytes(held)
+                    break
+
+    def length(self, session_id: str) -> int:
+        return self._session(session_id).length
+
+    def tail(self, session_id: str, n: int) -> list[Turn]:
+        hot = self._session(session_id)
+        n = min(n, hot.length)
+        if n <= 0:
+            return []
+        return self.range(session_id, hot.length - n, hot.length)
+
+    def range(self, session_id: str, start: int, end: int) -> list[Turn]:
+        hot = self._session(session_id)
+        end = min(end, hot.length)
+        if start >= end:
+            return []
+        if hot.tail and start >= hot.tail[0][0]:
+            return [turn for seq, turn in hot.tail if start <= seq < end]
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT turn FROM turns WHERE session_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (session_id, start, end),
+            ).fetchall()
+        return [json.loads(raw) for (raw,) in rows]
+
+    def release(self, session_id: str) -> None:
+        # Turns stay on disk; only the RAM copy goes
+        self._hot.pop(session_id, None)
+
+    def delete(self, session_id: str) -> None:
+        # Removes the session from RAM and disk
+        self._hot.pop(session_id, None)
+        with self._lock:
+            self._db.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+
+    def _maybe_sweep(self) -> None:
+        now = time.monotonic()
+        if now - self._last_sweep >= min(60.0, self.idle_seconds):
+            self._last_sweep = now
+            self.evict_idle()
+        if self.retention_days > 0 and now - self._last_purge >= SESSION_PURGE_SECONDS:
+            self._last_purge = now
+            self.purge_expired()
+
+    def evict_idle(self) -> int:
+        cutoff = time.monotonic() - self.idle_seconds
+        idle = [sid for sid, hot in self._hot.items() if hot.last_access < cutoff]
+        for sid in idle:
+            del self._hot[sid]
+        self.evicted += len(idle)
+        return len(idle)
+
+    def purge_expired(self) -> int:
+        # Deletes sessions whose newest turn is past the retention period;
+        # sessions still in RAM are in use and kept
+        if self.retention_days <= 0:
+            return 0
+        cutoff = time.time() - self.retention_days * 86400
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT session_id FROM turns GROUP BY session_id HAVING MAX(created_at) < ?", (cutoff,)
+            ).fetchall()
+        expired = [sid for (sid,) in rows if sid not in self._hot]
+        for sid in expired:
+            self.delete(sid)
+        self.purged += len(expired)
+        return len(expired)
+
+    def memory_usage(self, session_id: str) -> int:
+        hot = self._hot.get(session_id)
+        return hot.bytes if hot else 0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": "sqlite",
+            "sessions_in_ram": len(self._hot),
+            "turns_in_ram": sum(len(h.tail) for h in self._hot.values()),
+            "bytes_in_ram": sum(h.bytes for h in self._hot.values()),
+            "evicted": self.evicted,
+            "purged": self.purged,
+        }
+
+# Shared process-wide store, chosen from the environment
+session_store = SqliteSessionStore() if SESSION_STORE == "sqlite" else MemorySessionStore()
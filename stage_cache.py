@@ -0,0 +1,94 @@
+# stage_cache.py
+# Content-addressed cache for multi-agent pipeline stages. A stage's output is
+# keyed on (stage, model name, instructions, normalized prompt), so a repeated
+# query skips every stage whose input is unchanged. Storage is the same
+# memory LRU + TTL + optional SQLite tier used for guardrail verdicts.
+import os
+import re
+import hashlib
+from dataclasses import dataclass
+from typing import Any
+from agents import Agent
+from verdict_cache import VerdictCache
+
+STAGE_CACHE_ENABLED = os.getenv("STAGE_CACHE_ENABLED", "1") != "0"
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s.!?]+$")
+
+# -----------------------------
+# 1️⃣ Key parts
+# -----------------------------
+def normalize_prompt(prompt: str) -> str:
+    # Unlike guardrail verdicts, numbers matter here: only case, spacing and
+    # trailing punctuation are folded
+    prompt = _WHITESPACE.sub(" ", prompt.lower()).strip()
+    return _TRAILING_PUNCTUATION.sub("", prompt)
+
+def model_name(agent: Agent) -> str:
+    # Unwrap BudgetedModel-style wrappers down to the named model
+    model = agent.model
+    while model is not None and not isinstance(model, str):
+        name = getattr(model, "model", None)
+        if isinstance(name, str):
+            return name
+        model = getattr(model, "inner", None)
+    return model or ""
+
+# -----------------------------
+# 2️⃣ Per-stage cache
+# -----------------------------
+@dataclass
+class StageStats:
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+class StageCache:
+    def __init__(self, max_entries: int = 2_000, ttl: float = 6 * 3600, db_path: str | None = None,
+                 enabled: bool = True):
+        self.enabled = enabled
+        self.store = VerdictCache(max_entries=max_entries, ttl=ttl, db_path=db_path, table="stage_outputs")
+        self.per_stage: dict[str, StageStats] = {}
+
+    @staticmethod
+    def key(stage: str, agent: Agent, prompt: str) -> str:
+        raw = "\0".join((stage, model_name(agent), str(agent.instructions or ""), normalize_prompt(prompt)))
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, stage: str, key: str) -> str | None:
+        if not self.enabled:
+            return None
+        value = self.store.get(key)
+        stats = self.per_stage.setdefault(stage, StageStats())
+        if value is None:
+            stats.misses += 1
+            return None
+        stats.hits += 1
+        return value["response"]
+
+    def put(self, key: str, response: str) -> None:
+        # Stored in AgentOutput's shape so streamed and structured runs share entries
+        if self.enabled and response:
+            self.store.put(key, {"response": response})
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            **self.store.stats(),
+            "stages": {
+                stage: {"hits": s.hits, "misses": s.misses, "hit_rate": s.hit_rate}
+                for stage, s in self.per_stage.items()
+            },
+        }
+
+# Shared process-wide cache, configured from the environment
+stage_cache = StageCache(
+    max_entries=int(os.getenv("STAGE_CACHE_SIZE", "2000")),
+    ttl=float(os.getenv("STAGE_CACHE_TTL", str(6 * 3600))),
+    db_path=os.getenv("STAGE_CACHE_DB") or None,
+    enabled=STAGE_CACHE_ENABLED,
+)
@@ -0,0 +1,138 @@
+# stage_pipeline.py
+# Pipelined streaming for chains of agents (research → summary → plan). Each
+# stage streams its tokens into its own UI section, and the next stage starts
+# as soon as its upstream has produced enough complete paragraphs instead of
+# waiting for the whole generation.
+#
+# Limitation: a stage that starts early is prompted with the upstream's
+# complete paragraphs at that moment and is not told about anything the
+# upstream writes afterwards; that tail is dropped from its input (counted
+# in `dropped_chars` and logged). With PIPELINE_MIN_PARAGRAPHS=0, the
+# default, every stage waits for its full upstream output.
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+from agents import Agent, Runner
+from openai.types.responses import ResponseTextDeltaEvent
+from json_stream import JsonFieldStream
+from stage_cache import stage_cache
+
+logger = logging.getLogger(__name__)
+
+# Complete upstream paragraphs needed before a downstream stage starts;
+# 0 waits for the whole upstream output (stage-by-stage streaming only).
+# Opt-in, see the limitation above
+PIPELINE_MIN_PARAGRAPHS = int(os.getenv("PIPELINE_MIN_PARAGRAPHS", "0"))
+
+# -----------------------------
+# 1️⃣ One streamed stage
+# -----------------------------
+@dataclass
+class PipelineStage:
+    label: str
+    agent: Agent
+    build_prompt: Callable[[str], str]
+    output_field: str | None = None  # string field to stream for structured agents
+    text: str = ""
+    ttft: float | None = None        # seconds from stage start to first token
+    duration: float | None = None
+    started_early: bool = False      # began on a partial upstream output
+    cached: bool = False             # served from the stage cache
+    dropped_chars: int = 0           # upstream output written after an early start
+    ready: asyncio.Event = field(default_factory=asyncio.Event)
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def complete_paragraphs(self) -> str:
+        # Everything up to the last blank line is final
+        cut = self.text.rfind("\n\n")
+        return self.text[:cut] if cut >= 0 else ""
+
+    def paragraph_count(self) -> int:
+        return len([p for p in self.complete_paragraphs().split("\n\n") if p.strip()])
+
+    async def run(self, prompt: str, on_token: Callable[[str], Awaitable[Any]], min_paragraphs: int) -> None:
+        start = time.perf_counter()
+        key = stage_cache.key(self.agent.name, self.agent, prompt)
+        try:
+            cached = stage_cache.get(self.agent.name, key)
+            if cached is not None:
+                self.cached = True
+                self.text = cached
+                self.ttft = time.perf_counter() - start
+                await on_token(cached)
+                return
+            extractor = JsonFieldStream(self.output_field) if self.output_field else None
+            result = Runner.run_streamed(self.agent, prompt)
+            async for event in result.stream_events():
+                if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                    delta = extractor.feed(event.data.delta) if extractor else event.data.delta
+                    if not delta:
+                        continue
+                    if self.ttft is None:
+                        self.ttft = time.perf_counter() - start
+                    self.text += delta
+                    await on_token(delta)
+                    if min_paragraphs and not self.ready.is_set() and self.paragraph_count() >= min_paragraphs:
+                        self.ready.set()
+            final = result.final_output
+            if self.output_field and not isinstance(final, str):
+                final = getattr(final, self.output_field)
+            if isinstance(final, str):
+                if not self.text:
+                    await on_token(final)
+                self.text = final
+            stage_cache.put(key, self.text)
+        finally:
+            self.duration = time.perf_counter() - start
+            self.done.set()
+            self.ready.set()
+
+# -----------------------------
+# 2️⃣ Chained stages
+# -----------------------------
+async def run_pipeline(
+    stages: list[PipelineStage],
+    query: str,
+    open_section: Callable[[PipelineStage], Awaitable[Callable[[str], Awaitable[Any]]]],
+    min_paragraphs: int = PIPELINE_MIN_PARAGRAPHS,
+) -> list[PipelineStage]:
+    # `open_section` creates the UI section for a stage and returns its token sink
+    async def run_stage(stage: PipelineStage, upstream: PipelineStage | None) -> None:
+        if upstream is None:
+            upstream_text = query
+        else:
+            await upstream.ready.wait()
+            stage.started_early = not upstream.done.is_set()
+            upstream_text = upstream.complete_paragraphs() if stage.started_early else upstream.text
+        on_token = await open_section(stage)
+        await stage.run(stage.build_prompt(upstream_text), on_token, min_paragraphs)
+        if stage.started_early:
+            await upstream.done.wait()
+            stage.dropped_chars = max(0, len(upstream.text) - len(upstream_text))
+            if stage.dropped_chars:
+                logger.warning(
+                    "stage %s started early and never saw the last %d characters of %s",
+                    stage.label, stage.dropped_chars, upstream.label,
+                )
+
+    tasks = []
+    upstream = None
+    for stage in stages:
+        tasks.append(asyncio.create_task(run_stage(stage, upstream)))
+        upstream = stage
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    for stage in stages:
+        logger.info(
+            "stage %s ttft=%.3fs duration=%.3fs early=%s dropped=%d cached=%s",
+            stage.label, stage.ttft or 0.0, stage.duration or 0.0, stage.started_early, stage.dropped_chars,
+            stage.cached,
+        )
+    return stages
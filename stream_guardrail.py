@@ -0,0 +1,128 @@
+# stream_guardrail.py
+# Incremental output guardrail: checks a streamed answer in windows while it
+# is being generated, holds back a small tail before flushing to the UI and
+# cancels the run as soon as a window is flagged.
+import os
+import asyncio
+from typing import Awaitable, Callable
+from agents import RunResultStreaming
+from openai.types.responses import ResponseTextDeltaEvent
+
+# -----------------------------
+# 1️⃣ Settings
+# -----------------------------
+# First window size; each later window doubles so the number of checks grows
+# with log(answer length) rather than linearly.
+WINDOW_CHARS = int(os.getenv("STREAM_GUARDRAIL_WINDOW_CHARS", "400"))
+# Tail that is never shown before the window containing it has been checked
+HOLDBACK_CHARS = int(os.getenv("STREAM_GUARDRAIL_HOLDBACK_CHARS", "80"))
+# Upper bound on checks per answer, including the final one
+MAX_CHECKS = int(os.getenv("STREAM_GUARDRAIL_MAX_CHECKS", "3"))
+
+# -----------------------------
+# 2️⃣ Guard
+# -----------------------------
+class StreamingOutputGuard:
+    def __init__(
+        self,
+        check: Callable[[str], Awaitable[bool]],  # returns True on a violation
+        window_chars: int = WINDOW_CHARS,
+        holdback_chars: int = HOLDBACK_CHARS,
+        max_checks: int = MAX_CHECKS,
+    ):
+        self.check = check
+        self.holdback_chars = holdback_chars
+        self.text = ""
+        self.flushed = 0
+        self.checked = 0
+        self.checks_left = max(1, max_checks)
+        self.next_window = window_chars
+        self.tripped = asyncio.Event()
+        self._tasks: set[asyncio.Task] = set()
+
+    def feed(self, delta: str) -> str:
+        # Returns the part of the stream that is safe to show now
+        self.text += delta
+        # Keep one check in reserve for the tail in finish()
+        if self.checks_left > 1 and len(self.text) - self.checked >= self.next_window:
+            self._schedule(len(self.text))
+            self.next_window *= 2
+        safe_upto = max(self.flushed, len(self.text) - self.holdback_chars)
+        out = self.text[self.flushed:safe_upto]
+        self.flushed = safe_upto
+        return out
+
+    def _schedule(self, upto: int) -> None:
+        # Overlap the previous window so phrases split across edges are seen
+        window = self.text[max(0, self.checked - self.holdback_chars):upto]
+        self.checked = upto
+        self.checks_left -= 1
+        task = asyncio.create_task(self._run_check(window))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_check(self, window: str) -> None:
+        if await self.check(window):
+            self.tripped.set()
+
+    async def finish(self) -> bool:
+        # Check whatever is left and wait for pending checks; True when clean
+        if self.checked < len(self.text):
+            self._schedule(len(self.text))
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+        return not self.tripped.is_set()
+
+    def rest(self) -> str:
+        out = self.text[self.flushed:]
+        self.flushed = len(self.text)
+        return out
+
+    def cancel(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+    # -----------------------------
+    # 3️⃣ Driving a streamed run
+    # -----------------------------
+    async def pump(
+        self,
+        result: RunResultStreaming,
+        on_token: Callable[[str], Awaitable],
+        transform: Callable[[str], str] | None = None,
+    ) -> bool:
+        # Streams text deltas of `result` through the guard into `on_token`.
+        # Returns False (after cancelling the generation) if a window tripped.
+        # `transform` maps raw deltas first, e.g. JsonFieldStream.feed for
+        # structured outputs, so windows are checked on the visible text.
+        events = result.stream_events().__aiter__()
+        tripped = asyncio.create_task(self.tripped.wait())
+        try:
+            while True:
+                next_event = asyncio.ensure_future(events.__anext__())
+                done, _ = await asyncio.wait({next_event, tripped}, return_when=asyncio.FIRST_COMPLETED)
+                if tripped in done:
+                    next_event.cancel()
+                    await asyncio.gather(next_event, return_exceptions=True)
+                    result.cancel()
+                    self.cancel()
+                    return False
+                try:
+                    event = next_event.result()
+                except StopAsyncIteration:
+                    break
+                if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                    delta = transform(event.data.delta) if transform else event.data.delta
+                    safe = self.feed(delta)
+                    if safe:
+                        await on_token(safe)
+
+            if not await self.finish():
+                return False
+            tail = self.rest()
+            if tail:
+                await on_token(tail)
+            return True
+        finally:
+            tripped.cancel()
+            self.cancel()
@@ -0,0 +1,141 @@
+# token_usage.py
+# Token accounting per agent, per chat session and per process, and
+# per-session token budgets. Agents report usage through `usage_hooks`
+# (Agent(..., hooks=usage_hooks)); handlers run inside @track_session so
+# every call they trigger — guardrails and background summaries included —
+# is charged to the chat. A session past SESSION_TOKEN_DEGRADE_AT of its
+# budget gets shorter answers and skips optional stages; once the budget is
+# spent only cached content is served.
+import os
+import functools
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Callable
+from agents import Agent, AgentHooks, RunContextWrapper
+from agents.items import ModelResponse
+from metrics import metrics
+
+# -----------------------------
+# 1️⃣ Settings
+# -----------------------------
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "0"))            # 0 = unlimited
+SESSION_TOKEN_DEGRADE_AT = float(os.getenv("SESSION_TOKEN_DEGRADE_AT", "0.8"))  # fraction of the budget
+DEGRADED_MAX_TOKENS = int(os.getenv("DEGRADED_MAX_TOKENS", "300"))             # plain-text answers only
+
+BUDGET_MESSAGE = "🪫 This chat has used up its token budget. Start a new chat to continue."
+BRIEF_INSTRUCTIONS = "Keep the answer brief: at most a few short sentences or bullet points."
+
+NORMAL, DEGRADED, EXHAUSTED = "normal", "degraded", "exhausted"
+
+# -----------------------------
+# 2️⃣ Usage totals & ledger
+# -----------------------------
+@dataclass
+class UsageTotals:
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    total_tokens: int = 0
+
+    def add(self, usage: Any) -> None:
+        self.requests += usage.requests
+        self.input_tokens += usage.input_tokens
+        self.output_tokens += usage.output_tokens
+        self.total_tokens += usage.total_tokens
+
+class UsageLedger:
+    def __init__(self, budget: int = SESSION_TOKEN_BUDGET, degrade_at: float = SESSION_TOKEN_DEGRADE_AT):
+        self.budget = budget
+        self.degrade_at = degrade_at
+        self.process = UsageTotals()
+        self.agents: dict[str, UsageTotals] = {}
+        self.sessions: dict[str, UsageTotals] = {}
+
+    def record(self, agent_name: str, session_id: str | None, usage: Any) -> None:
+        self.process.add(usage)
+        self.agents.setdefault(agent_name, UsageTotals()).add(usage)
+        if session_id is not None:
+            self.sessions.setdefault(session_id, UsageTotals()).add(usage)
+        metrics.inc("tokens_total", usage.input_tokens, agent=agent_name, kind="input")
+        metrics.inc("tokens_total", usage.output_tokens, agent=agent_name, kind="output")
+
+    def session(self, session_id: str | None) -> UsageTotals:
+        return self.sessions.get(session_id, UsageTotals()) if session_id is not None else UsageTotals()
+
+    def level(self, session_id: str | None) -> str:
+        if not self.budget or session_id is None:
+            return NORMAL
+        used = self.session(session_id).total_tokens
+        if used >= self.budget:
+            return EXHAUSTED
+        return DEGRADED if used >= self.degrade_at * self.budget else NORMAL
+
+    def release(self, session_id: str | None) -> None:
+        # On chat end; the per-agent and process totals keep its usage
+        self.sessions.pop(session_id, None)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "process": asdict(self.process),
+            "agents": {name: asdict(totals) for name, totals in self.agents.items()},
+            "active_sessions": len(self.sessions),
+            "session_budget": self.budget,
+        }
+
+# Shared process-wide ledger
+ledger = UsageLedger()
+
+# -----------------------------
+# 3️⃣ Agent hooks & session scope
+# -----------------------------
+_session_var: ContextVar[str | None] = ContextVar("token_usage_session", default=None)
+
+def current_session() -> str | None:
+    return _session_var.get()
+
+class UsageHooks(AgentHooks):
+    # Runs after every model response of the agent it is attached to;
+    # clones (agent.clone()) keep the hooks and are counted under their name
+    async def on_llm_end(self, context: RunContextWrapper, agent: Agent, response: ModelResponse) -> None:
+        ledger.record(agent.name, _session_var.get(), response.usage)
+
+usage_hooks = UsageHooks()
+
+def track_session(get_session_id: Callable[[], str | None]):
+    # Charges every model call made while the handler runs to its chat:
+    #   @track_session(lambda: cl.user_session.get("id"))
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = _session_var.set(get_session_id())
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _session_var.reset(token)
+        return wrapper
+    return decorator
+
+def budget_level() -> str:
+    return ledger.level(_session_var.get())
+
+# -----------------------------
+# 4️⃣ Degraded agents
+# -----------------------------
+_brief_agents: dict[int, tuple[Agent, Agent]] = {}
+
+def brief(agent: Agent) -> Agent:
+    # Same agent asked for a short answer. Structured outputs are not capped
+    # with max_tokens: a truncated JSON object would fail to parse.
+    cached = _brief_agents.get(id(agent))
+    if cached is not None and cached[0] is agent:
+        return cached[1]
+    instructions = f"{agent.instructions}\n\n{BRIEF_INSTRUCTIONS}" if isinstance(agent.instructions, str) else BRIEF_INSTRUCTIONS
+    settings = agent.model_settings
+    if agent.output_type is None or agent.output_type is str:
+        settings = replace(settings, max_tokens=min(settings.max_tokens or DEGRADED_MAX_TOKENS, DEGRADED_MAX_TOKENS))
+    clone = agent.clone(instructions=instructions, model_settings=settings)
+    _brief_agents[id(agent)] = (agent, clone)
+    return clone
+
+def for_budget(agent: Agent) -> Agent:
+    return brief(agent) if budget_level() != NORMAL else agent
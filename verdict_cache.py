@@ -0,0 +1,215 @@
+# verdict_cache.py
+# Cache for guardrail classifier verdicts (e.g. MathHomeworkOutput), keyed on
+# the normalized input (every turn of it, when the guardrail sees the chat
+# history) so repeated / trivially re-phrased messages skip the
+# guardrail agent's LLM round trip. In-memory LRU + TTL, optional SQLite tier.
+import os
+import re
+import asyncio
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+from agents import Agent, Runner, TResponseInputItem
+
+# -----------------------------
+# 1️⃣ Input normalization
+# -----------------------------
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+_OPERATOR_SPACING = re.compile(r"\s*([-+*/^=<>()])\s*")
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s.!?]+$")
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return ""
+
+def input_text(input: str | list[TResponseInputItem]) -> str:
+    # Guardrails see either the raw message or the full chat history; this
+    # is the latest user turn
+    if isinstance(input, str):
+        return input
+    for item in reversed(input):
+        if isinstance(item, dict) and item.get("role") == "user":
+            return _content_text(item.get("content"))
+    return ""
+
+def is_single_turn(input: str | list[TResponseInputItem]) -> bool:
+    # A lone message, as a string or a one-item history
+    return isinstance(input, str) or (
+        len(input) == 1 and isinstance(input[0], dict) and input[0].get("role") == "user"
+    )
+
+def input_key(input: str | list[TResponseInputItem]) -> str:
+    # The whole input is keyed: "and the next one?" gets a different verdict
+    # after every history. A single-turn list keys like the bare string.
+    if is_single_turn(input):
+        return normalize(input_text(input))
+    return "\0".join(
+        f"{item.get('role')}:{normalize(_content_text(item.get('content')))}"
+        for item in input if isinstance(item, dict)
+    )
+
+def normalize(text: str) -> str:
+    # "Solve 2x + 3 = 11 !" and "solve 5x+1=6" share a key: the numbers do
+    # not change whether a message is homework.
+    text = text.lower()
+    text = _NUMBER.sub("0", text)
+    text = _OPERATOR_SPACING.sub(r"\1", text)
+    text = _WHITESPACE.sub(" ", text).strip()
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+# -----------------------------
+# 2️⃣ Cache – memory LRU + optional SQLite
+# -----------------------------
+class VerdictCache:
+    def __init__(self, max_entries: int = 10_000, ttl: float = 24 * 3600, db_path: str | None = None,
+                 table: str = "verdicts"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.table = table
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+
+    @staticmethod
+    def key(namespace: str, input: str | list[TResponseInputItem]) -> str:
+        raw = f"{namespace}\0{input_key(input)}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+            if row is not None and row[1] > now:
+                value = json.loads(row[0])
+                self._remember(key, row[1], value)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value: dict[str, Any]) -> None:
+        expires_at = time.time() + self.ttl
+        self._remember(key, expires_at, value)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at),
+                )
+
+    def _remember(self, key: str, expires_at: float, value: dict[str, Any]) -> None:
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def purge_expired(self) -> None:
+        now = time.time()
+        for key in [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+# Shared process-wide cache, configured from the environment
+verdict_cache = VerdictCache(
+    max_entries=int(os.getenv("GUARDRAIL_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("GUARDRAIL_CACHE_TTL", str(24 * 3600))),
+    db_path=os.getenv("GUARDRAIL_CACHE_DB") or None,
+)
+
+# -----------------------------
+# 3️⃣ Cached guardrail agent run
+# -----------------------------
+# Identical inputs classified concurrently share one in-flight LLM call
+_inflight: dict[str, asyncio.Future] = {}
+
+async def run_cached(
+    agent: Agent,
+    input: str | list[TResponseInputItem],
+    context: Any = None,
+    cache: VerdictCache = verdict_cache,
+    classify: Callable[[str | list[TResponseInputItem], Any], Awaitable[Any]] | None = None,
+) -> Any:
+    # `classify(input, context)` replaces the single agent run on a miss,
+    # e.g. guardrail_batch.MicroBatcher.classify
+    # Namespace on the agent's instructions so differently-prompted
+    # classifiers never share verdicts
+    key = cache.key(f"{agent.name}\0{agent.instructions}", input)
+    cached = cache.get(key)
+    if cached is not None:
+        return agent.output_type.model_validate(cached)
+
+    pending = _inflight.get(key)
+    if pending is not None:
+        value = await asyncio.shield(pending)
+        if value is None:
+            # The chat that owned the call was cancelled: classify here instead
+            return await run_cached(agent, input, context, cache, classify)
+        return agent.output_type.model_validate(value)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        if classify is not None:
+            verdict = await classify(input, context)
+        else:
+            verdict = (await Runner.run(agent, input, context=context)).final_output
+        value = verdict.model_dump()
+        cache.put(key, value)
+        future.set_result(value)
+        return verdict
+    except asyncio.CancelledError:
+        # One user pressing stop must not cancel the others waiting on this
+        # call: they get None and run the classification themselves
+        future.set_result(None)
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Waiters re-raise it; avoid "exception was never retrieved" otherwise
+        future.exception()
+        raise
+    finally:
+        del _inflight[key]